@@ -1,35 +1,51 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exc, delete, func
-from typing import Annotated
+from sqlalchemy import select, exc, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Annotated, Any
+import asyncio
 ###
 from oss_archive.utils.logger import logger
-from oss_archive.database.index import get_async_db
+from oss_archive.database.index import get_async_db, get_read_only_async_db, get_read_only_background_async_db, retry_on_primary
+from oss_archive.database import keyset, counts
 from oss_archive.database.models import Category as CategoryModel
-from oss_archive.database.helpers import does_category_exists
+from oss_archive.database.helpers import get_existing_categories_keys
 from oss_archive.schemas import category as category_schemas, api as api_schemas
 from oss_archive.components.categories import schema as component_schemas #, json as component_json
 from oss_archive.utils import json as json_utils
 
 router = APIRouter(tags=["Categories"])
 
+# Every listing's order ends with the unique key, so the sort tuple is unique for the cursor, and they're all indexed.
+SORT_COLUMNS: dict[str, keyset.SortColumnsType] = {
+    "priority": (CategoryModel.priority, CategoryModel.key),
+    "key": (CategoryModel.key,),
+    "updated_at": (CategoryModel.updated_at, CategoryModel.key),
+}
+
 @router.get(
     "/categories",
     status_code=status.HTTP_200_OK,
     response_model=api_schemas.GetAll_Res[category_schemas.DescriptiveSchema],
     response_model_exclude_none=True,
 )
-async def get_categories(queries: Annotated[api_schemas.SharedQueriesForGetAllRequests, Query()], db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_categories(queries: Annotated[api_schemas.SharedQueriesForGetAllRequests, Query()], db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
+    sort_columns = SORT_COLUMNS[queries.order_by]
+    try:
+        after = keyset.decode_cursor(queries.cursor, queries.order_by, queries.order, sort_columns) if queries.cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor, it should be a next_cursor of the same order_by & order")
     try: #
-        stmt = select(CategoryModel).offset(queries.offset).limit(queries.limit)
+        stmt = keyset.paginate(select(CategoryModel), sort_columns, queries.order, queries.limit, after)
+        if after is None:
+            stmt = stmt.offset(queries.offset)
         resp  = await db.scalars(statement=stmt)
-        result = resp.all()
+        result, next_cursor = keyset.get_page(resp.all(), queries.order_by, queries.order, sort_columns, queries.limit)
         categories: list[category_schemas.DescriptiveSchema] =  [category_schemas.DescriptiveSchema.model_validate(item, from_attributes=True) for item in list(result)]
 
-        count_resp = await db.execute(select(func.count()).select_from(CategoryModel))
-        count =  count_resp.scalar()
+        count = await counts.get_count(db, CategoryModel, strategy=queries.count)
 
-        return api_schemas.GetAll_Res[category_schemas.DescriptiveSchema](data=categories, offset=queries.offset, limit=queries.limit, total_count=count)
+        return api_schemas.GetAll_Res[category_schemas.DescriptiveSchema](data=categories, offset=queries.offset, limit=queries.limit, total_count=count, next_cursor=next_cursor)
 
     except Exception as e:
         logger.error("Error when getting categories", error=e)
@@ -42,7 +58,7 @@ async def get_categories(queries: Annotated[api_schemas.SharedQueriesForGetAllRe
     response_model=component_schemas.GetCategoryByKey_Res,
     response_model_exclude_none=True
 )
-async def get_category_by_key(key: str, db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_category_by_key(key: str, db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
     try:
         stmt = select(CategoryModel).where(CategoryModel.key == key)
         res = await db.scalars(statement=stmt)
@@ -90,17 +106,27 @@ async def create_categories(req_body: component_schemas.CreateCategories_Req, db
         new_categories: list[category_schemas.FullSchema] = []
         already_exists: list[str] = []
 
+        # A single query for which of them exist, then a single INSERT ... RETURNING for the new ones.
+        existing_keys = await get_existing_categories_keys([category.key for category in req_body.categories], async_db=db)
+        if existing_keys is None:
+            raise Exception("Couldn't get the existing categories")
+
+        new_rows: list[dict[str, Any]] = []
         for category in req_body.categories:
-            does_exist = await does_category_exists(category.key, db)
-            if does_exist:
+            if category.key in existing_keys:
                 already_exists.append(category.key)
                 continue
-            else:
-                new_category = CategoryModel(**category.model_dump())        
-                _ = db.add(new_category)
-                await db.commit()
-                await db.refresh(new_category)
-                new_categories.append(category_schemas.FullSchema.model_validate(new_category, from_attributes=True))
+            existing_keys.add(category.key) # so it isn't inserted twice if it's repeated
+            new_rows.append(category.model_dump())
+
+        if len(new_rows) > 0:
+            # ON CONFLICT DO NOTHING, in case one of them is created after checking, then it's not returned.
+            stmt = pg_insert(CategoryModel).on_conflict_do_nothing().returning(CategoryModel)
+            res = await db.scalars(stmt, new_rows)
+            new_categories = [category_schemas.FullSchema.model_validate(new_category, from_attributes=True) for new_category in res.all()]
+            await db.commit()
+            inserted_keys = {new_category.key for new_category in new_categories}
+            already_exists.extend(row["key"] for row in new_rows if row["key"] not in inserted_keys)
 
         return component_schemas.CreateCategories_Res(
             new_categories=new_categories,
@@ -109,6 +135,7 @@ async def create_categories(req_body: component_schemas.CreateCategories_Req, db
 
     except Exception as e:
         logger.error("Error occurred while creating a categories", error=e)
+        await db.rollback()
         detail_msg = "An error occurred while creating a categories, try again later."
         raise HTTPException(status.HTTP_406_NOT_ACCEPTABLE, detail=detail_msg)
 
@@ -118,23 +145,40 @@ async def create_categories(req_body: component_schemas.CreateCategories_Req, db
     response_model=api_schemas.Update_Res,
     response_model_exclude_none=True
 )
-async def sync_json(db: Annotated[AsyncSession, Depends(get_async_db)]):
-    try:
-        json_utils.del_files(json_utils.CategoriesJSONFileConfig)
+async def sync_json(db: Annotated[AsyncSession, Depends(get_read_only_background_async_db)]):
+    # Streaming rows ordered by priority, so every file is written as soon as it's full, instead of loading the whole table.
+    # Only changed files are rewritten, and the obsolete ones are deleted after all files are written.
+    async def write_json(db: AsyncSession):
+        stmt = select(CategoryModel).order_by(CategoryModel.priority, CategoryModel.key).execution_options(yield_per=json_utils.DEFAULT_MAX_LENGTH)
+        res = await db.stream_scalars(statement=stmt)
+        writer = json_utils.JSONFilesWriter(json_utils.CategoriesJSONFileConfig)
+        async for item in res:
+            await writer.async_add(category_schemas.JSONSchema.model_validate(item, from_attributes=True))
+        await writer.async_close()
 
-        stmt = select(CategoryModel).order_by(CategoryModel.key)
-        res = await db.scalars(statement=stmt)
-        result = res.all()
-
-        categories: list[category_schemas.JSONSchema] = [category_schemas.JSONSchema.model_validate(item, from_attributes=True) for item in list(result)]
-
-        json_utils.write_json_files(json_utils.CategoriesJSONFileConfig, categories)
+    try:
+        # It's written again from the primary if the replica cancels the long query.
+        await retry_on_primary(db, write_json)
 
         return api_schemas.Update_Res()
     except Exception as e:
         logger.error("ERROR", error=e)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
 
+@router.get(
+    "/categories/json/verify",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schemas.VerifyJSON_Res,
+)
+async def verify_json():
+    try:
+        # Hashing the files in a thread, so it doesn't block the event loop.
+        result = await asyncio.to_thread(json_utils.verify_json_files, json_utils.CategoriesJSONFileConfig)
+        return api_schemas.VerifyJSON_Res(**result)
+    except Exception as e:
+        logger.error("ERROR", error=e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
+
 @router.put(
     "/categories/{key}",
     status_code=status.HTTP_202_ACCEPTED,
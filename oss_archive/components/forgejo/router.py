@@ -6,7 +6,7 @@ from oss_archive.utils import httpx
 from oss_archive.utils.logger import logger
 from oss_archive.components.forgejo.schema import ForgejoOrganization, ForgejoUser, ForgejoRepo, ForgejoLicense, ForgejoLicensesListItem, CreateOrgReqBody, AddUserReqBody, MigrateRepoReqBody
 from oss_archive.components.forgejo import tasks as component_tasks
-from oss_archive.components.forgejo.shared import base_headers
+from oss_archive.components.forgejo.shared import base_headers, forgejo_singleflight, get_from_forgejo
 
 router = APIRouter(tags=["Forgejo"])
 
@@ -19,11 +19,7 @@ router = APIRouter(tags=["Forgejo"])
     response_model_exclude_none=True
 )
 async def get_all_orgs() :
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint="/admin/orgs",
-        headers=base_headers
-        )
+    res = await get_from_forgejo("/admin/orgs")
 
     if res is None:
         return None
@@ -44,11 +40,7 @@ async def get_all_orgs() :
     response_model_exclude_none=True,
 )
 async def get_org(org_name: str):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=F"/orgs/{org_name}",
-        headers=base_headers
-        )
+    res = await get_from_forgejo(F"/orgs/{org_name}")
 
     if res is None or res.status_code != 200:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find orgs")
@@ -65,11 +57,7 @@ async def get_org(org_name: str):
 )
 async def get_orgs_repos(org_name: str):
     try:
-        res = await httpx.async_get(
-            base_url=Forgejo.get("base_url") or "",
-            endpoint=F"/orgs/{org_name}/repos",
-            headers=base_headers
-        )
+        res = await get_from_forgejo(F"/orgs/{org_name}/repos")
         if res is None or res.status_code != 200:
             raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't get org's repos")
         else:
@@ -107,6 +95,7 @@ async def create_org_for_user(body: CreateOrgReqBody):
         if result is None or result.status_code != 201:
             raise Exception("Couldn't create org")
 
+        forgejo_singleflight.clear()
         new_org = result.json()
         return new_org
     except Exception as e:
@@ -149,6 +138,7 @@ async def delete_org(org_name: str):
     )
 
     if result is not None and result.status_code == 204:
+        forgejo_singleflight.clear()
         return
     else:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find user")
@@ -164,11 +154,7 @@ async def delete_org(org_name: str):
     response_model_exclude_none=True
 )
 async def get_all_users() :
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint="/admin/users",
-        headers=base_headers
-    )
+    res = await get_from_forgejo("/admin/users")
 
     if res is None or res.status_code != 200:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't get users")
@@ -190,11 +176,7 @@ async def get_all_users() :
     response_model_exclude_none=True,
 )
 async def get_user(username: str):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=F"/users/{username}",
-        headers=base_headers
-    )
+    res = await get_from_forgejo(F"/users/{username}")
 
     if res is None or res.status_code != 200:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find user")
@@ -210,11 +192,7 @@ async def get_user(username: str):
     response_model_exclude_none=True
 )
 async def get_user_repos(username: str):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=F"/users/{username}/repos",
-        headers=base_headers
-    )
+    res = await get_from_forgejo(F"/users/{username}/repos")
     if res is None or res.status_code != 200:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find user")
     data: list[Any] = res.json()
@@ -244,6 +222,7 @@ async def add_user(user_data: AddUserReqBody):
         )  
         if result is None:
             raise Exception("Couldn't create user")
+        forgejo_singleflight.clear()
         # if result.status_code != 201:
         #     # raise error
         #     pass
@@ -267,6 +246,7 @@ async def delete_user(username: str):
             headers=base_headers
         ) 
         if result is not None and result.status_code == 204:
+            forgejo_singleflight.clear()
             return
         else:
             raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find user")
@@ -292,11 +272,7 @@ async def delete_user(username: str):
     response_model_exclude_none=True
 )
 async def get_repos(page: int = 1, limit: int = 10):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=f"/repos/search?page={page}&limit={limit}",
-        headers=base_headers
-    )
+    res = await get_from_forgejo(f"/repos/search?page={page}&limit={limit}")
 
     if res is None or res.status_code != 200:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error while getting repos")
@@ -312,11 +288,7 @@ async def get_repos(page: int = 1, limit: int = 10):
     response_model_exclude_none=True
 )
 async def get_repo(owner: str, repo: str):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=f"/repos/{owner}/{repo}",
-        headers=base_headers
-    )
+    res = await get_from_forgejo(f"/repos/{owner}/{repo}")
     
     if res is None or res.status_code != 200:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repo is not Found")
@@ -350,11 +322,7 @@ async def migrate_repo(body: MigrateRepoReqBody, background_tasks: BackgroundTas
     response_model_exclude_none=True
 )
 async def get_licenses():
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint="/licenses",
-        headers=base_headers
-    )
+    res = await get_from_forgejo("/licenses")
     if res is None or res.status_code != 200:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error while getting licenses")
     licenses = res.json()
@@ -367,11 +335,7 @@ async def get_licenses():
     response_model_exclude_none=True
 )
 async def get_license_by_key(key: str):
-    res = await httpx.async_get(
-        base_url=Forgejo.get("base_url") or "",
-        endpoint=f"/licenses/{key}",
-        headers=base_headers
-    )
+    res = await get_from_forgejo(f"/licenses/{key}")
     if res is None or res.status_code != 200:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Couldn't find license")
     
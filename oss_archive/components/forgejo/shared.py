@@ -1,10 +1,28 @@
-from httpx import Headers
+from httpx import Headers, Response
 ### 
 from oss_archive.config import Forgejo
+from oss_archive.utils import httpx
+from oss_archive.utils.singleflight import Singleflight
 
 base_headers = Headers(
     headers={
         "Authorization": f"token {Forgejo.get("access_token")}",
         "Content-Type": "application/json",
         }
-    )
\ No newline at end of file
+    )
+
+# Coalesces identical in-flight GET requests to Forgejo, so clients polling the same page make a single upstream request.
+forgejo_singleflight = Singleflight(ttl=Forgejo.get("proxy_cache_ttl"))
+
+async def get_from_forgejo(endpoint: str) -> Response | None:
+    """Make a GET request to Forgejo's endpoint, sharing the response with identical requests that are in-flight.
+    Only successful (2xx) responses are kept for the TTL, so a transient error (5xx, 429...etc) isn't replayed."""
+    return await forgejo_singleflight.do(
+        endpoint,
+        lambda: httpx.async_get(
+            base_url=Forgejo.get("base_url") or "",
+            endpoint=endpoint,
+            headers=base_headers
+        ),
+        keep=lambda res: res is not None and res.is_success,
+    )
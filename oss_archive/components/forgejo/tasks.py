@@ -4,7 +4,7 @@ from oss_archive.config import Forgejo
 from oss_archive.utils import httpx
 from oss_archive.utils.logger import logger
 from oss_archive.components.forgejo.schema import ForgejoRepo, MigrateRepoReqBody
-from oss_archive.components.forgejo.shared import base_headers
+from oss_archive.components.forgejo.shared import base_headers, forgejo_singleflight
 
 
 async def migrate_repo(repo_data: MigrateRepoReqBody):
@@ -22,6 +22,9 @@ async def migrate_repo(repo_data: MigrateRepoReqBody):
         logger.error("Migrating error", result="result is Noen")
         return
 
+    if result.is_success:
+        forgejo_singleflight.clear() # so the repos' listings show the new repo
+
     new_repo: ForgejoRepo = result.json()
     logger.info("Mirrored repo correctly", repo=f"{repo_data.repo_owner}/{repo_data.repo_name}", source=repo_data.clone_addr)
     return new_repo 
\ No newline at end of file
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exc, delete, func
+from sqlalchemy import select, exc, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import joinedload
 from uuid import UUID
-from typing import Annotated
+from typing import Annotated, Any
+import asyncio
 ###
-from oss_archive.database.index import get_async_db
+from oss_archive.database.index import get_async_db, get_read_only_async_db, get_read_only_background_async_db, retry_on_primary
+from oss_archive.database import keyset, counts
 from oss_archive.database.models import OSS as OSSModel
-from oss_archive.database.helpers import does_oss_exists
+from oss_archive.database.helpers import get_existing_oss_fullnames
 from oss_archive.utils.logger import logger
 from oss_archive.components.oss import schema as component_schemas
 from oss_archive.schemas import oss as oss_schemas, api as api_schemas
@@ -16,23 +19,42 @@ from oss_archive.utils import formatter, json as json_utils
 
 router = APIRouter(tags=["OSS"])
 
+# Every listing's order ends with the unique key, so the sort tuple is unique for the cursor, and they're all indexed.
+SORT_COLUMNS: dict[str, keyset.SortColumnsType] = {
+    "priority": (OSSModel.priority, OSSModel.fullname),
+    "key": (OSSModel.fullname,),
+    "updated_at": (OSSModel.updated_at, OSSModel.fullname),
+}
+
 @router.get(
     "/oss",
     status_code=status.HTTP_200_OK,
     response_model=api_schemas.GetAll_Res[oss_schemas.DescriptiveSchema],
     response_model_exclude_none=True,
 )
-async def get_all_oss(queries: Annotated[api_schemas.SharedQueriesForGetAllRequests, Query()], db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_all_oss(queries: Annotated[component_schemas.GetAllOSS_Queries, Query()], db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
+    sort_columns = SORT_COLUMNS[queries.order_by]
+    try:
+        after = keyset.decode_cursor(queries.cursor, queries.order_by, queries.order, sort_columns) if queries.cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor, it should be a next_cursor of the same order_by & order")
     try:
-        stmt = select(OSSModel).offset(queries.offset).limit(queries.limit)
+        # Only the given filters, they're counted by the same columns (see database/counts).
+        filters = {column: value for column, value in {
+            OSSModel.main_category_key: queries.main_category_key,
+            OSSModel.owner_username: queries.owner_username,
+            OSSModel.is_mirrored: queries.is_mirrored,
+        }.items() if value is not None}
+        stmt = keyset.paginate(select(OSSModel).where(*[column == value for column, value in filters.items()]), sort_columns, queries.order, queries.limit, after)
+        if after is None:
+            stmt = stmt.offset(queries.offset)
         resp = await db.scalars(statement=stmt)
-        result = resp.all()
+        result, next_cursor = keyset.get_page(resp.all(), queries.order_by, queries.order, sort_columns, queries.limit)
         all_oss: list[oss_schemas.DescriptiveSchema] =  [oss_schemas.DescriptiveSchema.model_validate(item, from_attributes=True) for item in list(result)]
 
-        count_resp = await db.execute(select(func.count()).select_from(OSSModel))
-        count =  count_resp.scalar()
+        count = await counts.get_count(db, OSSModel, filters, queries.count)
 
-        return api_schemas.GetAll_Res[oss_schemas.DescriptiveSchema](data=all_oss, offset=queries.offset, limit=queries.limit, total_count=count)
+        return api_schemas.GetAll_Res[oss_schemas.DescriptiveSchema](data=all_oss, offset=queries.offset, limit=queries.limit, total_count=count, next_cursor=next_cursor)
     except Exception as e:
         logger.error("Error when getting all OSS", error=e)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
@@ -44,7 +66,7 @@ async def get_all_oss(queries: Annotated[api_schemas.SharedQueriesForGetAllReque
     response_model=component_schemas.GetOSSByID_Res,
     response_model_exclude_none=True
 )
-async def get_oss_by_id(id: UUID, db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_oss_by_id(id: UUID, db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
     try:
         stmt = select(OSSModel).where(OSSModel.id == id)
         res = await db.scalars(statement=stmt)
@@ -93,19 +115,28 @@ async def create_many_oss(req_body: component_schemas.CreateManyOSS_Req, db: Ann
         new_oss_list: list[oss_schemas.FullSchema] = []
         already_exists: list[str] = []
 
-        for oss in req_body.oss_list:
-            oss_fullname = formatter.format_oss_fullname(oss.owner_username, oss.repo_name)
-            does_exist = await does_oss_exists(oss_fullname, db)
-            if does_exist:
+        oss_fullnames = [formatter.format_oss_fullname(oss.owner_username, oss.repo_name) for oss in req_body.oss_list]
+        # A single query for which of them exist, then a single INSERT ... RETURNING for the new ones.
+        existing_fullnames = await get_existing_oss_fullnames(oss_fullnames, async_db=db)
+        if existing_fullnames is None:
+            raise Exception("Couldn't get the existing OSS")
+
+        new_rows: list[dict[str, Any]] = []
+        for oss, oss_fullname in zip(req_body.oss_list, oss_fullnames):
+            if oss_fullname in existing_fullnames:
                 already_exists.append(oss_fullname)
                 continue
-            else:
-                new_oss = OSSModel(**oss.model_dump())    
-                new_oss.fullname = oss_fullname    
-                _ = db.add(new_oss)
-                await db.commit()
-                await db.refresh(new_oss)
-                new_oss_list.append(oss_schemas.FullSchema.model_validate(new_oss, from_attributes=True))
+            existing_fullnames.add(oss_fullname) # so it isn't inserted twice if it's repeated
+            new_rows.append({**oss.model_dump(), "fullname": oss_fullname})
+
+        if len(new_rows) > 0:
+            # ON CONFLICT DO NOTHING, in case one of them is created after checking, then it's not returned.
+            stmt = pg_insert(OSSModel).on_conflict_do_nothing().returning(OSSModel)
+            res = await db.scalars(stmt, new_rows)
+            new_oss_list = [oss_schemas.FullSchema.model_validate(new_oss, from_attributes=True) for new_oss in res.all()]
+            await db.commit()
+            inserted_fullnames = {new_oss.fullname for new_oss in new_oss_list}
+            already_exists.extend(row["fullname"] for row in new_rows if row["fullname"] not in inserted_fullnames)
 
         return component_schemas.CreateManyOSS_Res(
             new_oss_list=new_oss_list,
@@ -114,6 +145,7 @@ async def create_many_oss(req_body: component_schemas.CreateManyOSS_Req, db: Ann
 
     except Exception as e:
         logger.error("Error occurred while creating many OSS", error=e)
+        await db.rollback()
         detail_msg = "An error occurred while creating many OSS, try again later."
         raise HTTPException(status.HTTP_406_NOT_ACCEPTABLE, detail=detail_msg)
 
@@ -124,23 +156,40 @@ async def create_many_oss(req_body: component_schemas.CreateManyOSS_Req, db: Ann
     response_model=api_schemas.Update_Res,
     response_model_exclude_none=True
 )
-async def sync_json(db: Annotated[AsyncSession, Depends(get_async_db)]):
-    try:
-        json_utils.del_files(json_utils.OSSJSONFileConfig)
+async def sync_json(db: Annotated[AsyncSession, Depends(get_read_only_background_async_db)]):
+    # Streaming rows ordered by priority, so every file is written as soon as it's full, instead of loading the whole table.
+    # Only changed files are rewritten, and the obsolete ones are deleted after all files are written.
+    async def write_json(db: AsyncSession):
+        stmt = select(OSSModel).order_by(OSSModel.priority, OSSModel.fullname).execution_options(yield_per=json_utils.DEFAULT_MAX_LENGTH)
+        res = await db.stream_scalars(statement=stmt)
+        writer = json_utils.JSONFilesWriter(json_utils.OSSJSONFileConfig)
+        async for item in res:
+            await writer.async_add(oss_schemas.JSONSchema.model_validate(item, from_attributes=True))
+        await writer.async_close()
 
-        stmt = select(OSSModel).order_by(OSSModel.fullname)
-        res = await db.scalars(statement=stmt)
-        result = res.all()
-
-        oss_list: list[oss_schemas.JSONSchema] = [oss_schemas.JSONSchema.model_validate(item, from_attributes=True) for item in list(result)]
-
-        json_utils.write_json_files(json_utils.OSSJSONFileConfig, oss_list)
+    try:
+        # It's written again from the primary if the replica cancels the long query.
+        await retry_on_primary(db, write_json)
 
         return api_schemas.Update_Res()
     except Exception as e:
         logger.error("ERROR", error=e)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
 
+@router.get(
+    "/oss/json/verify",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schemas.VerifyJSON_Res,
+)
+async def verify_json():
+    try:
+        # Hashing the files in a thread, so it doesn't block the event loop.
+        result = await asyncio.to_thread(json_utils.verify_json_files, json_utils.OSSJSONFileConfig)
+        return api_schemas.VerifyJSON_Res(**result)
+    except Exception as e:
+        logger.error("ERROR", error=e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
+
 
 @router.put(
     "/oss/{id}",
@@ -4,7 +4,15 @@
 from pydantic import BaseModel, Field
 from typing import Annotated
 ###
-from oss_archive.schemas import oss,  general
+from oss_archive.schemas import oss,  general, api
+
+class GetAllOSS_Queries(
+    api.SharedQueriesForGetAllRequests,
+    general.MainCategoryKeyField_Optional,
+    general.OwnerUsernameField_Optional,
+    oss.IsMirroredField_Optional,
+    ):
+    pass
 
 class GetOSSByID_Res(
     oss.DescriptiveSchema
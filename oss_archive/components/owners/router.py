@@ -1,39 +1,59 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exc, delete, func
+from sqlalchemy import select, exc, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import joinedload
 from uuid import UUID
-from typing import Annotated
+from typing import Annotated, Any
+import asyncio
 ###
 from oss_archive.utils.logger import logger
-from oss_archive.database.index import get_async_db
+from oss_archive.database.index import get_async_db, get_read_only_async_db, get_read_only_background_async_db, retry_on_primary
+from oss_archive.database import keyset, counts
 from oss_archive.database.models import Owner as OwnerModel, Category as CategoryModel
-from oss_archive.database.helpers import does_owner_exists
+from oss_archive.database.helpers import get_existing_owners_usernames
 from oss_archive.schemas import owner as owner_schemas, api as api_schemas
 from oss_archive.components.owners import schema as component_schemas
 from oss_archive.utils import json as json_utils
 
 router = APIRouter(tags=["Owners"])
 
+# Every listing's order ends with the unique key, so the sort tuple is unique for the cursor, and they're all indexed.
+SORT_COLUMNS: dict[str, keyset.SortColumnsType] = {
+    "priority": (OwnerModel.priority, OwnerModel.username),
+    "key": (OwnerModel.username,),
+    "updated_at": (OwnerModel.updated_at, OwnerModel.username),
+}
+
 @router.get(
     "/owners",
     status_code=status.HTTP_200_OK,
     response_model=api_schemas.GetAll_Res[owner_schemas.DescriptiveSchema],
     response_model_exclude_none=True
 )
-async def get_owners(queries: Annotated[api_schemas.SharedQueriesForGetAllRequests, Query()],db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_owners(queries: Annotated[component_schemas.GetOwners_Queries, Query()],db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
+    sort_columns = SORT_COLUMNS[queries.order_by]
+    try:
+        after = keyset.decode_cursor(queries.cursor, queries.order_by, queries.order, sort_columns) if queries.cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor, it should be a next_cursor of the same order_by & order")
     try:
         #.options(joinedload(Owner.meta_list).load_only(MetaList.key, MetaList.name))
-        stmt = select(OwnerModel).offset(queries.offset).limit(queries.limit)
+        # Only the given filters, they're counted by the same columns (see database/counts).
+        filters = {column: value for column, value in {
+            OwnerModel.main_category_key: queries.main_category_key,
+        }.items() if value is not None}
+        stmt = keyset.paginate(select(OwnerModel).where(*[column == value for column, value in filters.items()]), sort_columns, queries.order, queries.limit, after)
+        if after is None:
+            stmt = stmt.offset(queries.offset)
         resp  = await db.scalars(statement=stmt)
-        result = resp.all()
+        result, next_cursor = keyset.get_page(resp.all(), queries.order_by, queries.order, sort_columns, queries.limit)
         owners: list[owner_schemas.DescriptiveSchema] =  [owner_schemas.DescriptiveSchema.model_validate(item, from_attributes=True) for item in list(result)]
 
 
-        count_resp = await db.execute(select(func.count()).select_from(OwnerModel))
-        count =  count_resp.scalar()
+        count = await counts.get_count(db, OwnerModel, filters, queries.count)
 
-        return api_schemas.GetAll_Res[owner_schemas.DescriptiveSchema](data=owners, offset=queries.offset, limit=queries.limit, total_count=count)
+        return api_schemas.GetAll_Res[owner_schemas.DescriptiveSchema](data=owners, offset=queries.offset, limit=queries.limit, total_count=count, next_cursor=next_cursor)
 
     except Exception as e:
         logger.error("Error when getting owners", error=e)
@@ -45,7 +65,7 @@ async def get_owners(queries: Annotated[api_schemas.SharedQueriesForGetAllReques
     response_model=component_schemas.GetOwnerByID_Res,
     response_model_exclude_none=True
 )
-async def get_owner_by_id(id: UUID, db: Annotated[AsyncSession, Depends(get_async_db)]):
+async def get_owner_by_id(id: UUID, db: Annotated[AsyncSession, Depends(get_read_only_async_db)]):
     try:
         stmt = select(OwnerModel).where(OwnerModel.id == id)#.options(joinedload(Owner.meta_list).load_only(MetaList.key, MetaList.name)).options(joinedload(Owner.os_softwares).load_only(OSSoftware.id, OSSoftware.name))
 
@@ -94,17 +114,27 @@ async def create_owners(req_body: component_schemas.CreateOwners_Req, db: Annota
         new_owners: list[owner_schemas.FullSchema] = []
         already_exists: list[str] = []
 
+        # A single query for which of them exist, then a single INSERT ... RETURNING for the new ones.
+        existing_usernames = await get_existing_owners_usernames([owner.username for owner in req_body.owners], async_db=db)
+        if existing_usernames is None:
+            raise Exception("Couldn't get the existing owners")
+
+        new_rows: list[dict[str, Any]] = []
         for owner in req_body.owners:
-            does_exist = await does_owner_exists(owner.username, async_db=db)
-            if does_exist:
+            if owner.username in existing_usernames:
                 already_exists.append(owner.username)
                 continue
-            else:
-                new_owner = OwnerModel(**owner.model_dump())        
-                _ = db.add(new_owner)
-                await db.commit()
-                await db.refresh(new_owner)
-                new_owners.append(owner_schemas.FullSchema.model_validate(new_owner, from_attributes=True))
+            existing_usernames.add(owner.username) # so it isn't inserted twice if it's repeated
+            new_rows.append(owner.model_dump())
+
+        if len(new_rows) > 0:
+            # ON CONFLICT DO NOTHING, in case one of them is created after checking, then it's not returned.
+            stmt = pg_insert(OwnerModel).on_conflict_do_nothing().returning(OwnerModel)
+            res = await db.scalars(stmt, new_rows)
+            new_owners = [owner_schemas.FullSchema.model_validate(new_owner, from_attributes=True) for new_owner in res.all()]
+            await db.commit()
+            inserted_usernames = {new_owner.username for new_owner in new_owners}
+            already_exists.extend(row["username"] for row in new_rows if row["username"] not in inserted_usernames)
 
         return component_schemas.CreateOwners_Res(
             new_owners=new_owners,
@@ -113,6 +143,7 @@ async def create_owners(req_body: component_schemas.CreateOwners_Req, db: Annota
 
     except Exception as e:
         logger.error("Error occurred while creating a owners", error=e)
+        await db.rollback()
         detail_msg = "An error occurred while creating a owners, try again later."
         raise HTTPException(status.HTTP_406_NOT_ACCEPTABLE, detail=detail_msg)
 
@@ -122,23 +153,40 @@ async def create_owners(req_body: component_schemas.CreateOwners_Req, db: Annota
     response_model=api_schemas.Update_Res,
     response_model_exclude_none=True
 )
-async def sync_json(db: Annotated[AsyncSession, Depends(get_async_db)]):
-    try:
-        json_utils.del_files(json_utils.OwnersJSONFileConfig)
-
-        stmt = select(OwnerModel).order_by(OwnerModel.username)
-        res = await db.scalars(statement=stmt)
-        result = res.all()
+async def sync_json(db: Annotated[AsyncSession, Depends(get_read_only_background_async_db)]):
+    # Streaming rows ordered by priority, so every file is written as soon as it's full, instead of loading the whole table.
+    # Only changed files are rewritten, and the obsolete ones are deleted after all files are written.
+    async def write_json(db: AsyncSession):
+        stmt = select(OwnerModel).order_by(OwnerModel.priority, OwnerModel.username).execution_options(yield_per=json_utils.DEFAULT_MAX_LENGTH)
+        res = await db.stream_scalars(statement=stmt)
+        writer = json_utils.JSONFilesWriter(json_utils.OwnersJSONFileConfig)
+        async for item in res:
+            await writer.async_add(owner_schemas.JSONSchema.model_validate(item, from_attributes=True))
+        await writer.async_close()
 
-        owners: list[owner_schemas.JSONSchema] = [owner_schemas.JSONSchema.model_validate(item, from_attributes=True) for item in list(result)]
-
-        json_utils.write_json_files(json_utils.OwnersJSONFileConfig, owners)
+    try:
+        # It's written again from the primary if the replica cancels the long query.
+        await retry_on_primary(db, write_json)
 
         return api_schemas.Update_Res()
     except Exception as e:
         logger.error("ERROR", error=e)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
 
+@router.get(
+    "/owners/json/verify",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schemas.VerifyJSON_Res,
+)
+async def verify_json():
+    try:
+        # Hashing the files in a thread, so it doesn't block the event loop.
+        result = await asyncio.to_thread(json_utils.verify_json_files, json_utils.OwnersJSONFileConfig)
+        return api_schemas.VerifyJSON_Res(**result)
+    except Exception as e:
+        logger.error("ERROR", error=e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown error, try again later")
+
 @router.put(
     "/owners/{id}",
     status_code=status.HTTP_202_ACCEPTED,
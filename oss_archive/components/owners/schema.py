@@ -2,10 +2,16 @@
 from pydantic import Field, BaseModel
 from typing import Annotated
 # ###
-from oss_archive.schemas import owner, category, general
+from oss_archive.schemas import owner, category, general, api
 
 
 
+class GetOwners_Queries(
+    api.SharedQueriesForGetAllRequests,
+    general.MainCategoryKeyField_Optional,
+    ):
+    pass
+
 class GetOwnerByID_Res(
     owner.DescriptiveSchema,
     ):
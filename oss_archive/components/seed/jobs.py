@@ -0,0 +1,117 @@
+"""In-memory registry of the seeding jobs running in the background, so they're lost when the app restarts,
+but seeding owners' OSS is journaled, so the next job resumes it.
+
+The registry is per process, so a job also holds a Postgres advisory lock while it's running,
+so only one job runs at a time across all the app's workers."""
+from typing import Literal
+from datetime import datetime
+from uuid import UUID, uuid4
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+###
+from oss_archive.utils.logger import logger
+from oss_archive.database.index import BackgroundAsyncSessionLocal, background_async_engine
+from oss_archive.seeders.index import seed_owners_oss
+from oss_archive.seeders.progress import SeedProgress
+
+MAX_FINISHED_JOBS = 20 # finished jobs kept to be asked about, the older ones are dropped
+SEED_LOCK_NAME = "oss_archive:seed" # the advisory lock's key is its hash
+
+
+class SeedJob():
+    def __init__(self):
+        self.id: UUID = uuid4()
+        self.status: Literal["running", "succeeded", "failed"] = "running"
+        self.created_at: datetime = datetime.now()
+        self.finished_at: datetime | None = None
+        self.error: str | None = None
+        self.progress: SeedProgress = SeedProgress()
+        self.task: asyncio.Task[None] | None = None
+
+__jobs: dict[UUID, SeedJob] = {}
+
+
+def get_job(job_id: UUID) -> SeedJob | None:
+    return __jobs.get(job_id)
+
+def get_running_job() -> SeedJob | None:
+    for job in __jobs.values():
+        if job.status == "running":
+            return job
+    return None
+
+async def start_job() -> SeedJob | None:
+    """Start seeding owners' OSS as a background task, or return None if there's a job running already (in this worker or another one),
+    as 2 runs at once would resume the same journal."""
+    if get_running_job() is not None:
+        return None
+    lock_connection = await __lock_seeding()
+    if lock_connection is None:
+        return None
+
+    __drop_old_jobs()
+    job = SeedJob()
+    __jobs[job.id] = job
+    # The task is kept in the job, so it isn't garbage collected while running.
+    job.task = asyncio.create_task(__run_job(job, lock_connection))
+    return job
+
+async def cancel_jobs():
+    """Cancel the running jobs, like when the app is shutting down."""
+    tasks = [job.task for job in __jobs.values() if job.task is not None and not job.task.done()]
+    for task in tasks:
+        _ = task.cancel()
+    _ = await asyncio.gather(*tasks, return_exceptions=True)
+
+async def __lock_seeding() -> AsyncConnection | None:
+    """Take the seeding's advisory lock on a connection of its own, that's kept till the job finishes,
+    as a session-level lock is held by the connection, and the pipeline's session gives its connection back to the pool on every commit.
+    Returns None if another worker holds it."""
+    lock_connection = await background_async_engine.connect()
+    try:
+        is_locked = await lock_connection.scalar(text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": SEED_LOCK_NAME})
+        await lock_connection.commit() # the lock is kept after the commit, so the connection isn't left idle in transaction
+    except BaseException:
+        await lock_connection.close()
+        raise
+    if not is_locked:
+        await lock_connection.close()
+        return None
+    return lock_connection
+
+async def __unlock_seeding(lock_connection: AsyncConnection):
+    try:
+        _ = await lock_connection.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": SEED_LOCK_NAME})
+        await lock_connection.commit()
+        await lock_connection.close()
+    except Exception as e:
+        # Dropping the connection instead of giving it back to the pool, so Postgres releases the lock as its session ends.
+        logger.error("Couldn't release the seeding's lock", error=e)
+        await lock_connection.invalidate()
+        await lock_connection.close()
+
+async def __run_job(job: SeedJob, lock_connection: AsyncConnection):
+    logger.info("Seed job started", job_id=job.id)
+    try:
+        async with BackgroundAsyncSessionLocal() as db:
+            await seed_owners_oss(db, job.progress)
+        job.status = "succeeded"
+        logger.info("Seed job succeeded", job_id=job.id, **job.progress.to_dict())
+    except asyncio.CancelledError:
+        job.status = "failed"
+        job.error = "Cancelled"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.error("Seed job failed", job_id=job.id, error=e)
+    finally:
+        await __unlock_seeding(lock_connection)
+        job.finished_at = datetime.now()
+        job.progress.finish()
+
+def __drop_old_jobs():
+    finished_jobs = sorted([job for job in __jobs.values() if job.status != "running"], key=lambda job: job.created_at)
+    for job in finished_jobs[:max(len(finished_jobs) - MAX_FINISHED_JOBS + 1, 0)]:
+        del __jobs[job.id]
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, status
+from uuid import UUID
+###
+from oss_archive.components.seed import jobs as seed_jobs
+from oss_archive.components.seed import schema as component_schemas
+
+router = APIRouter(tags=["Seed"])
+
+
+def __to_response(job: seed_jobs.SeedJob) -> component_schemas.SeedJob_Res:
+    return component_schemas.SeedJob_Res(
+        id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        progress=component_schemas.SeedProgress(**job.progress.to_dict()),
+    )
+
+@router.post(
+    "/seed/jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=component_schemas.SeedJob_Res,
+)
+async def start_seed_job():
+    """Start seeding owners' OSS in the background, and return its job right away, to follow it using GET /seed/jobs/{id}."""
+    job = await seed_jobs.start_job()
+    if job is None:
+        running_job = seed_jobs.get_running_job()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"There's a seed job running already: {running_job.id if running_job is not None else 'in another worker'}")
+    return __to_response(job)
+
+@router.get(
+    "/seed/jobs/{id}",
+    status_code=status.HTTP_200_OK,
+    response_model=component_schemas.SeedJob_Res,
+)
+async def get_seed_job(id: UUID):
+    job = seed_jobs.get_job(id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Seed job is not found!")
+    return __to_response(job)
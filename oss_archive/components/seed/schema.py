@@ -0,0 +1,25 @@
+from pydantic import Field, BaseModel
+from datetime import datetime
+from typing import Annotated, Literal
+from uuid import UUID
+
+
+class SeedProgress(BaseModel):
+    owners_total: Annotated[int, Field()]
+    owners_done: Annotated[int, Field()]
+    repos_fetched: Annotated[int, Field()]
+    oss_written: Annotated[int, Field(description="OSS upserted, new or already existing")]
+    oss_inserted: Annotated[int, Field(description="New OSS only")]
+    oss_failed: Annotated[int, Field(description="OSS in batches that couldn't be written")]
+    errors: Annotated[int, Field()]
+    elapsed_seconds: Annotated[float, Field()]
+    repos_per_second: Annotated[float, Field()]
+    oss_per_second: Annotated[float, Field()]
+
+class SeedJob_Res(BaseModel):
+    id: Annotated[UUID, Field()]
+    status: Annotated[Literal["running", "succeeded", "failed"], Field()]
+    created_at: Annotated[datetime, Field()]
+    finished_at: Annotated[datetime | None, Field(default=None)]
+    error: Annotated[str | None, Field(default=None)]
+    progress: Annotated[SeedProgress, Field()]
@@ -1,5 +1,5 @@
 from dotenv import dotenv_values
-from typing import TypedDict
+from typing import TypedDict, Literal
 
 
 __env = dotenv_values(".env")
@@ -10,6 +10,11 @@ ARCHIVE_BASE_PATH = __env.get("ARCHIVE_BASE_PATH")
 COMPRESSED_ARCHIVE_BASE_PATH = __env.get("COMPRESSED_ARCHIVE_BASE_PATH")
 
 JSON_FILES_PATH = __env.get("JSON_FILES_PATH")
+JSON_PARSE_WORKERS = int(__env.get("JSON_PARSE_WORKERS") or 0) or None # processes parsing JSON files at once, None uses all CPU cores
+# The format exports are written with, json: a JSON file for every 100 items, ndjson.zst: zstd-compressed newline-delimited JSON, with bigger files (needs python 3.14+ or the zstd extra),
+# imports read every file in its own format (by its extension), so switching it keeps the old archive importable
+JSON_ARCHIVE_FORMAT: Literal["json", "ndjson.zst"] = "ndjson.zst" if __env.get("JSON_ARCHIVE_FORMAT") == "ndjson.zst" else "json"
+JSON_ARCHIVE_CHUNK_SIZE = int(__env.get("JSON_ARCHIVE_CHUNK_SIZE") or 0) or None # max items in a file, None uses the format's default
 
 class DatabaseConfigType(TypedDict):
     user: str
@@ -32,15 +37,117 @@ DB = DatabaseConfigType(
     conn_str=  F"host={__env.get("DB_HOST")} port={__env.get("DB_PORT")} user={__env.get("DB_USER")} dbname={__env.get("DB_NAME")} password={__env.get("DB_PASSWORD")} sslmode=disable"        
     )
 
+class DatabasePoolConfigType(TypedDict):
+    size: int # connections kept open
+    max_overflow: int # extra connections opened when all of the kept ones are used, then closed when they're returned
+    timeout: float # seconds to wait for a free connection, before raising an error
+    pre_ping: bool # check the connection before using it, so connections closed by the server (like after a restart) are replaced
+    recycle: int # seconds to replace a connection after, -1 to never replace them
+
+# API requests and background work (seeding, importing & exporting json-archives) have their own pools,
+# so a long seeding can't use all connections, and leave none for the API.
+DBPool = DatabasePoolConfigType(
+    size = int(__env.get("DB_POOL_SIZE") or 10),
+    max_overflow = int(__env.get("DB_POOL_MAX_OVERFLOW") or 10),
+    timeout = float(__env.get("DB_POOL_TIMEOUT") or 30),
+    pre_ping = __env.get("DB_POOL_PRE_PING") != "false",
+    recycle = int(__env.get("DB_POOL_RECYCLE") or 1800),
+)
+
+class DatabaseReplicaConfigType(TypedDict):
+    host: str | None # None means there's no replica, and all queries go to the primary
+    port: int
+    pin_seconds: float # after a client writes, its reads go to the primary for this long, so it reads its writes while the replica catches up
+
+__replica_port = __env.get("DB_REPLICA_PORT")
+# A read-only replica of the primary database (with the same name, user & password), for read-only endpoints.
+# Its hot_standby_feedback should be on (or max_standby_streaming_delay bigger), or long exports can be cancelled and retried on the primary.
+DBReplica = DatabaseReplicaConfigType(
+    host = __env.get("DB_REPLICA_HOST") or None,
+    port = int(__replica_port) if __replica_port else 5432,
+    pin_seconds = float(__env.get("DB_REPLICA_PIN_SECONDS") or 5),
+)
+
+BackgroundDBPool = DatabasePoolConfigType(
+    size = int(__env.get("DB_BACKGROUND_POOL_SIZE") or 4),
+    max_overflow = int(__env.get("DB_BACKGROUND_POOL_MAX_OVERFLOW") or 0),
+    timeout = float(__env.get("DB_BACKGROUND_POOL_TIMEOUT") or 60),
+    pre_ping = __env.get("DB_BACKGROUND_POOL_PRE_PING") != "false",
+    recycle = int(__env.get("DB_BACKGROUND_POOL_RECYCLE") or 1800),
+)
+
 class ForgejoType(TypedDict):
     base_url: str | None
     access_token: str | None
     admin_username: str | None
     org_for_mirrors: str | None
+    proxy_cache_ttl: float # seconds to share a proxied GET response, 0 means only coalescing in-flight requests
 
 Forgejo = ForgejoType(
     base_url = __env.get("FORGEJO_BASE_URL"),
     access_token = __env.get("FORGEJO_ACCESS_TOKEN"),
     admin_username = __env.get("FORGEJO_ADMIN_USERNAME"),
-    org_for_mirrors = __env.get("FORGEJO_ORG_FOR_MIRRORS")
-)
\ No newline at end of file
+    org_for_mirrors = __env.get("FORGEJO_ORG_FOR_MIRRORS"),
+    proxy_cache_ttl = float(__env.get("FORGEJO_PROXY_CACHE_TTL") or 0.0),
+)
+
+class HTTPXConfigType(TypedDict):
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    http2: bool
+
+HTTPX = HTTPXConfigType(
+    max_connections = int(__env.get("HTTPX_MAX_CONNECTIONS") or 100),
+    max_keepalive_connections = int(__env.get("HTTPX_MAX_KEEPALIVE_CONNECTIONS") or 20),
+    keepalive_expiry = float(__env.get("HTTPX_KEEPALIVE_EXPIRY") or 30.0),
+    http2 = (__env.get("HTTPX_HTTP2") or "false").lower() == "true", # requires the http2 extra ('h2' package): pip install .[http2]
+)
+
+class HTTPCacheConfigType(TypedDict):
+    path: str
+    max_size: int # in bytes
+
+HTTPCache = HTTPCacheConfigType(
+    path = __env.get("HTTP_CACHE_PATH") or "./.http-cache",
+    max_size = int(__env.get("HTTP_CACHE_MAX_SIZE") or 256 * 1024 * 1024),
+)
+
+class RateLimitConfigType(TypedDict):
+    burst: int # max requests that can be made at once, before pacing them
+    safety_margin: float # fraction of the source's reported budget that we use
+
+RateLimit = RateLimitConfigType(
+    burst = int(__env.get("RATE_LIMIT_BURST") or 10),
+    safety_margin = float(__env.get("RATE_LIMIT_SAFETY_MARGIN") or 0.9),
+)
+
+class SeederConfigType(TypedDict):
+    sources_concurrency: dict[str, int] # owners fetched at once from every source
+    transform_workers: int
+    queue_size: int # max items waiting between 2 stages of the seeding pipeline
+    batch_size: int # max OSS inserted by a single INSERT statement
+    on_conflict: Literal["nothing", "update"] # what to do with OSS that already exist, skip them or update their source fields, it's always "update" if incremental is on
+    incremental: bool # only get the repos that changed since the owner's last seeding (its watermark)
+
+Seeder = SeederConfigType(
+    sources_concurrency = {
+        "github": int(__env.get("SEEDER_GITHUB_CONCURRENCY") or 4),
+        "codeberg": int(__env.get("SEEDER_CODEBERG_CONCURRENCY") or 2),
+    },
+    transform_workers = int(__env.get("SEEDER_TRANSFORM_WORKERS") or 2),
+    queue_size = int(__env.get("SEEDER_QUEUE_SIZE") or 16),
+    batch_size = int(__env.get("SEEDER_BATCH_SIZE") or 500),
+    on_conflict = "update" if __env.get("SEEDER_ON_CONFLICT") == "update" else "nothing",
+    incremental = __env.get("SEEDER_INCREMENTAL") != "false",
+)
+
+class ListCountConfigType(TypedDict):
+    strategy: Literal["exact", "estimated", "cached", "none"] # how listings' total_count is counted, if the request didn't pick one (see database/counts)
+    cache_ttl: float # max seconds to keep a cached count, it's forgotten before that after any write
+
+__count_strategy = __env.get("LIST_COUNT_STRATEGY")
+ListCount = ListCountConfigType(
+    strategy = __count_strategy if __count_strategy in ("exact", "estimated", "cached", "none") else "cached",
+    cache_ttl = float(__env.get("LIST_COUNT_CACHE_TTL") or 300),
+)
@@ -0,0 +1,113 @@
+"""Showing the query plans of the hot queries with and without the models' indexes.
+Run it against a database that's already created by the app: python -m oss_archive.database.benchmark_indexes [oss_count]
+
+Everything runs in a single transaction that's rolled back at the end:
+the missing indexes are created, fake rows are inserted (if oss_count is more than 0) and analyzed, the plans are explained with the indexes,
+then the indexes are dropped and the plans are explained again, so nothing is changed in the database.
+
+Note: DROP INDEX locks the tables till the rollback, so don't run it against a database that's being used."""
+from typing import Any
+import sys
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+###
+from oss_archive.database.index import async_engine, create_missing_indexes
+from oss_archive.database.models import Base
+
+BENCHMARK_PREFIX = "benchmark-"
+
+# The queries' patterns of the routers, seeders and mirroring, with a fake key of every one of them.
+QUERIES: dict[str, tuple[str, dict[str, Any]]] = {
+    "Category's OSS": (
+        "SELECT * FROM oss_table WHERE main_category_key = :category_key ORDER BY priority LIMIT 100",
+        {"category_key": f"{BENCHMARK_PREFIX}category-1"},
+    ),
+    "Owner's OSS": (
+        "SELECT * FROM oss_table WHERE owner_username = :owner_username ORDER BY priority LIMIT 100",
+        {"owner_username": f"{BENCHMARK_PREFIX}owner-1"},
+    ),
+    "Next OSS to mirror": (
+        "SELECT * FROM oss_table WHERE is_mirrored = false ORDER BY priority LIMIT 100",
+        {},
+    ),
+    "Exporting OSS": (
+        "SELECT * FROM oss_table ORDER BY priority, fullname LIMIT 1000",
+        {},
+    ),
+    "Category's owners": (
+        "SELECT * FROM owners WHERE main_category_key = :category_key ORDER BY priority LIMIT 100",
+        {"category_key": f"{BENCHMARK_PREFIX}category-1"},
+    ),
+    "Category's related OSS": (
+        "SELECT oss_table.* FROM oss_table JOIN categories_oss_table ON categories_oss_table.oss_id = oss_table.id WHERE categories_oss_table.main_category_key = :category_key LIMIT 100",
+        {"category_key": f"{BENCHMARK_PREFIX}category-1"},
+    ),
+}
+
+
+async def __insert_fake_rows(connection: AsyncConnection, oss_count: int):
+    categories_count = max(oss_count // 10000, 10)
+    owners_count = max(oss_count // 100, 10)
+    params = {"prefix": BENCHMARK_PREFIX, "categories_count": categories_count, "owners_count": owners_count, "oss_count": oss_count}
+    _ = await connection.execute(text("""
+        INSERT INTO categories (key, name, topics, reviewed, priority)
+        SELECT :prefix || 'category-' || i, 'Category ' || i, '{}', false, i % 10 + 1
+        FROM generate_series(1, :categories_count) AS i
+        """), params)
+    _ = await connection.execute(text("""
+        INSERT INTO owners (username, type, source, other_sources, actions, actions_on, reviewed, priority, main_category_key)
+        SELECT :prefix || 'owner-' || i, 'Individual', 'github', '{}', 'ArchiveAll', '{}', false, i % 10 + 1,
+            :prefix || 'category-' || (i % :categories_count + 1)
+        FROM generate_series(1, :owners_count) AS i
+        """), params)
+    _ = await connection.execute(text("""
+        INSERT INTO oss_table (repo_name, fullname, topics, reviewed, is_mirrored, development_status, priority, main_category_key, owner_username)
+        SELECT 'repo-' || i, :prefix || 'owner-' || (i % :owners_count + 1) || '/repo-' || i, '{}', false, i % 5 <> 0, 'Ongoing', i % 10 + 1,
+            :prefix || 'category-' || (i % :categories_count + 1), :prefix || 'owner-' || (i % :owners_count + 1)
+        FROM generate_series(1, :oss_count) AS i
+        """), params)
+    _ = await connection.execute(text("""
+        INSERT INTO categories_oss_table (main_category_key, oss_id)
+        SELECT :prefix || 'category-' || (abs(hashtext(id::text)) % :categories_count + 1), id
+        FROM oss_table WHERE fullname LIKE :prefix || '%'
+        """), params)
+    for table in ["categories", "owners", "oss_table", "categories_oss_table"]:
+        _ = await connection.execute(text(f"ANALYZE {table}"))
+
+async def __explain_queries(connection: AsyncConnection) -> dict[str, str]:
+    plans: dict[str, str] = {}
+    for name, (query, params) in QUERIES.items():
+        res = await connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params)
+        plans[name] = "\n".join(row[0] for row in res)
+    return plans
+
+async def __drop_indexes(connection: AsyncConnection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            _ = await connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+async def benchmark_indexes(oss_count: int = 100000):
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            await connection.run_sync(create_missing_indexes) # if the app didn't create them yet
+            if oss_count > 0:
+                await __insert_fake_rows(connection, oss_count)
+            plans_with_indexes = await __explain_queries(connection)
+            await __drop_indexes(connection)
+            plans_without_indexes = await __explain_queries(connection)
+        finally:
+            await transaction.rollback()
+
+    for name in QUERIES:
+        print(f"===== {name} =====")
+        print("--- Without indexes ---")
+        print(plans_without_indexes[name])
+        print("--- With indexes ---")
+        print(plans_with_indexes[name])
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark_indexes(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
@@ -0,0 +1,95 @@
+"""Counting a listing's rows for its total_count, as an exact count(*) goes through the whole table (or all of the filtered rows),
+which costs more than getting the page itself on big tables like oss_table.
+
+Strategies, the request picks one of them or it's ListCount.strategy:
+- exact: SELECT count(*), always right, and always the slowest.
+- estimated: the table's pg_class.reltuples (updated by VACUUM/ANALYZE), or the planner's rows estimate if it's filtered.
+- cached: exact counts, kept till a write to their table is committed in this process,
+  or for ListCount.cache_ttl seconds at most (for writes from other processes). Filtered counts come from a single grouped count of the filters' columns,
+  like SELECT main_category_key, count(*) ... GROUP BY main_category_key, so all categories' counts are cached by one query.
+- none: no count at all."""
+from typing import Any, Literal
+import json
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import InstrumentedAttribute, DeclarativeBase
+from sqlalchemy.ext.asyncio import AsyncSession
+###
+from oss_archive.config import ListCount
+from oss_archive.utils.singleflight import Singleflight
+from oss_archive.database.index import AsyncSessionLocal, on_committed_writes
+
+CountStrategyType = Literal["exact", "estimated", "cached", "none"]
+FiltersType = dict[InstrumentedAttribute[Any], Any]
+
+# The grouped counts, keyed by "{table}:{filters' columns}", as {(filters' values): count},
+# coalesced so concurrent requests share a single count.
+counts_singleflight = Singleflight(ttl=ListCount.get("cache_ttl"))
+
+
+async def get_count(db: AsyncSession, model: type[DeclarativeBase], filters: FiltersType | None = None, strategy: CountStrategyType | None = None) -> int | None:
+    """Count the model's rows that match the filters (column == value), using the strategy.
+    Returns None for the "none" strategy."""
+    filters = filters or {}
+    strategy = strategy or ListCount.get("strategy")
+    if strategy == "none":
+        return None
+    elif strategy == "estimated":
+        return await __get_estimated_count(db, model, filters)
+    elif strategy == "cached":
+        return await __get_cached_count(model, filters)
+    return await __get_exact_count(db, model, filters)
+
+def invalidate_counts(tables: set[str] | None = None):
+    """Forget the cached counts of the tables, or all of them, it's called after every commit that writes to a table,
+    so writing other tables (like the seed journal) keeps the listed tables' counts.
+    The counts that are running are forgotten too, so they don't cache a count from before the write."""
+    if tables is None:
+        counts_singleflight.clear()
+        return
+    for table in tables:
+        counts_singleflight.clear(f"{table}:")
+
+
+def __filter(stmt: Any, filters: FiltersType) -> Any:
+    for column, value in filters.items():
+        stmt = stmt.where(column == value)
+    return stmt
+
+async def __get_exact_count(db: AsyncSession, model: type[DeclarativeBase], filters: FiltersType) -> int:
+    stmt = __filter(select(func.count()).select_from(model), filters)
+    return (await db.scalar(stmt)) or 0
+
+async def __get_estimated_count(db: AsyncSession, model: type[DeclarativeBase], filters: FiltersType) -> int:
+    if len(filters) == 0:
+        stmt = text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)")
+        reltuples = await db.scalar(stmt, {"table_name": model.__tablename__})
+        # It's -1 if the table is never vacuumed or analyzed yet.
+        if reltuples is not None and reltuples >= 0:
+            return int(reltuples)
+        return await __get_exact_count(db, model, filters)
+
+    # The filters' values are sent as bound parameters, so they're never parsed as SQL.
+    connection = await db.connection()
+    compiled = __filter(select(model), filters).compile(dialect=connection.dialect)
+    res = await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.construct_params())
+    explained = res.scalar()
+    plan = json.loads(explained) if isinstance(explained, str) else explained
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def __get_cached_count(model: type[DeclarativeBase], filters: FiltersType) -> int:
+    columns = sorted(filters.keys(), key=lambda column: column.key)
+    cache_key = f"{model.__tablename__}:{",".join(column.key for column in columns)}"
+
+    async def count_groups() -> dict[tuple[Any, ...], int]:
+        # Its own session, as it's shared by the coalesced requests, so it doesn't depend on the first request's session.
+        async with AsyncSessionLocal() as db:
+            stmt = select(*columns, func.count()).select_from(model).group_by(*columns)
+            res = await db.execute(stmt)
+            return {tuple(row[:-1]): row[-1] for row in res}
+
+    groups = await counts_singleflight.do(cache_key, count_groups)
+    return groups.get(tuple(filters[column] for column in columns), 0)
+
+
+# The cached counts of a table are forgotten right after a write to it is committed in this process.
+on_committed_writes(invalidate_counts)
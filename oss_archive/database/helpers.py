@@ -1,27 +1,26 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select, exc 
+from typing import Literal
+from datetime import datetime
+from uuid import UUID
+from collections.abc import Iterable
+from sqlalchemy.orm import Session, InstrumentedAttribute
+from sqlalchemy import select, update, delete, func, or_, literal_column, exists, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 ### 
 from oss_archive.utils.logger import logger
-from oss_archive.database.models import  Category as CategoryModel, Owner as OwnerModel, OSS as OSSModel
+from oss_archive.database.models import  Category as CategoryModel, Owner as OwnerModel, OSS as OSSModel, SeedWatermark as SeedWatermarkModel, SeedRun as SeedRunModel, SeedJournalEntry as SeedJournalEntryModel, ImportedJSONFile as ImportedJSONFileModel
 
 async def does_category_exists(category_key: str, async_db: AsyncSession | None = None, sync_db: Session | None = None) -> bool | None:
     """check if category exists, if result is None then there was unknown error.
     Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
     try:
-        stmt = select(CategoryModel).where(CategoryModel.key == category_key)
+        stmt = select(exists().where(CategoryModel.key == category_key))
         if async_db is not None:
-            res = await async_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
+            return bool(await async_db.scalar(statement=stmt))
         elif sync_db is not None:
-            res = sync_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
+            return bool(sync_db.scalar(statement=stmt))
         else:
             return None
-    except exc.NoResultFound:
-        return False
     except Exception as e:
         logger.error("Error checking category existence", category_key=category_key, error=e)
         return None
@@ -30,19 +29,13 @@ async def does_owner_exists(owner_username: str, async_db: AsyncSession | None =
     """check if owner exists, if result is None then there was unknown error.
     Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
     try:
-        stmt = select(OwnerModel).where(OwnerModel.username == owner_username)
+        stmt = select(exists().where(OwnerModel.username == owner_username))
         if async_db is not None:
-            res = await async_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
+            return bool(await async_db.scalar(statement=stmt))
         elif sync_db is not None:
-            res = sync_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
+            return bool(sync_db.scalar(statement=stmt))
         else:
             return None
-    except exc.NoResultFound:
-        return False
     except Exception as e:
         logger.error("Error checking owner existence", owner_username=owner_username, error=e)
         return None
@@ -51,23 +44,48 @@ async def does_oss_exists(oss_fullname: str, async_db: AsyncSession | None = Non
     """check if OSS exists, if result is None then there was unknown error.
     Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
     try:
-        stmt = select(OSSModel).where(OSSModel.fullname == oss_fullname)
+        stmt = select(exists().where(OSSModel.fullname == oss_fullname))
+        if async_db is not None:
+            return bool(await async_db.scalar(statement=stmt))
+        elif sync_db is not None:
+            return bool(sync_db.scalar(statement=stmt))
+        else:
+            return None
+    except Exception as e:
+        logger.error("Error checking OSS existence", oss_fullname=oss_fullname, error=e)
+        return None
+
+
+async def get_existing_keys(key_column: InstrumentedAttribute[str], keys: Iterable[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    """Get which of the keys exist, like get_existing_keys(CategoryModel.key, keys), using a single query for all of them:
+    SELECT key WHERE key = ANY(keys), as the keys are sent as a single array parameter. If result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    keys = list(set(keys))
+    if len(keys) == 0:
+        return set() if async_db is not None or sync_db is not None else None
+    try:
+        stmt = select(key_column).where(key_column == any_(bindparam("keys", keys, type_=ARRAY(String()))))
         if async_db is not None:
             res = await async_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
         elif sync_db is not None:
             res = sync_db.scalars(statement=stmt)
-            _ = res.one() # if it exists in won't raise an error
-            return True
         else:
             return None
-    except exc.NoResultFound:
-        return False
+
+        return set(res.all())
     except Exception as e:
-        logger.error("Error checking OSS existence", oss_fullname=oss_fullname, error=e)
+        logger.error("Unknown error getting existing keys", key_column=str(key_column), count=len(keys), error=e)
         return None
 
+async def get_existing_categories_keys(categories_keys: Iterable[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    return await get_existing_keys(CategoryModel.key, categories_keys, async_db=async_db, sync_db=sync_db)
+
+async def get_existing_owners_usernames(owners_usernames: Iterable[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    return await get_existing_keys(OwnerModel.username, owners_usernames, async_db=async_db, sync_db=sync_db)
+
+async def get_existing_oss_fullnames(oss_fullnames: Iterable[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    return await get_existing_keys(OSSModel.fullname, oss_fullnames, async_db=async_db, sync_db=sync_db)
+
 
 async def get_all_categories(async_db: AsyncSession | None = None, sync_db: Session | None = None):
     """Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
@@ -122,4 +140,244 @@ async def get_all_oss(async_db: AsyncSession | None = None, sync_db: Session | N
             return None
     except Exception as e:
         logger.error("Unknown error getting all OSS", error=e)
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_all_keys(key_column: InstrumentedAttribute[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    """Get all values of a table's key column, like all categories' keys using get_all_keys(CategoryModel.key),
+    to check which items exist in memory, instead of querying for every item. If result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = select(key_column)
+        if async_db is not None:
+            res = await async_db.scalars(statement=stmt)
+        elif sync_db is not None:
+            res = sync_db.scalars(statement=stmt)
+        else:
+            return None
+
+        return set(res.all())
+    except Exception as e:
+        logger.error("Unknown error getting all keys", key_column=str(key_column), error=e)
+        return None
+
+
+# OSS's columns we get from sources, the rest are left to their defaults.
+OSS_SEEDED_COLUMNS = ("repo_name", "fullname", "priority", "description", "topics", "reviewed", "is_mirrored", "development_status", "development_started_at", "html_url", "clone_url", "main_category_key", "owner_username")
+# Columns updated on conflict, the ones that change on the source, while reviewed fields like priority and categories are kept as they are.
+OSS_UPDATABLE_COLUMNS = ("description", "topics", "development_status", "development_started_at", "html_url", "clone_url")
+
+async def upsert_oss_list(oss_list: list[OSSModel], on_conflict: Literal["nothing", "update"] = "nothing", async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    """Insert the OSS list using a single INSERT ... ON CONFLICT (fullname) statement,
+    on conflict it does nothing, or updates the existing OSS if it has changed (on_conflict="update").
+    Returns the fullnames of the newly inserted OSS, if result is None then there was unknown error.
+    Note: it doesn't commit, and you have to pass async_db or sync_db, if you didn't it'll return None"""
+    if len(oss_list) == 0:
+        return set()
+    try:
+        rows = [{column: getattr(oss, column) for column in OSS_SEEDED_COLUMNS} for oss in oss_list]
+        for row in rows:
+            row["topics"] = row.get("topics") or []
+
+        stmt = pg_insert(OSSModel).values(rows)
+        if on_conflict == "update":
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[OSSModel.fullname],
+                set_={**{column: stmt.excluded[column] for column in OSS_UPDATABLE_COLUMNS}, "updated_at": func.now()},
+                # Skip rows that didn't change, so they aren't rewritten.
+                where=or_(*[OSSModel.__table__.c[column].is_distinct_from(stmt.excluded[column]) for column in OSS_UPDATABLE_COLUMNS]),
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[OSSModel.fullname])
+        # xmax is 0 for newly inserted rows, and it's the updating transaction's id for updated ones.
+        stmt = stmt.returning(OSSModel.fullname, literal_column("xmax = 0").label("inserted"))
+
+        if async_db is not None:
+            res = await async_db.execute(stmt)
+        elif sync_db is not None:
+            res = sync_db.execute(stmt)
+        else:
+            return None
+
+        return {row.fullname for row in res if row.inserted}
+    except Exception as e:
+        logger.error("Error upserting OSS list", count=len(oss_list), error=e)
+        return None
+
+
+async def get_seed_watermarks(async_db: AsyncSession | None = None, sync_db: Session | None = None) -> dict[str, SeedWatermarkModel] | None:
+    """Get all owners' seed watermarks by owner's username.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = select(SeedWatermarkModel)
+        if async_db is not None:
+            res = await async_db.scalars(statement=stmt)
+        elif sync_db is not None:
+            res = sync_db.scalars(statement=stmt)
+        else:
+            return None
+
+        return {watermark.owner_username: watermark for watermark in res.all()}
+    except Exception as e:
+        logger.error("Error getting seed watermarks", error=e)
+        return None
+
+async def upsert_seed_watermarks(watermarks: dict[str, datetime | None], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> bool | None:
+    """Save the owners' watermarks {owner_username: last_pushed_at} and set their last run to now,
+    if result is None then there was unknown error.
+    Note: it doesn't commit, and you have to pass async_db or sync_db, if you didn't it'll return None"""
+    if len(watermarks) == 0:
+        return True
+    try:
+        stmt = pg_insert(SeedWatermarkModel).values([
+            {"owner_username": owner_username, "last_pushed_at": last_pushed_at, "last_run_at": func.now()}
+            for owner_username, last_pushed_at in watermarks.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SeedWatermarkModel.owner_username],
+            # Never move the watermark back, like when a source returns fewer repos than before.
+            set_={
+                "last_pushed_at": func.greatest(SeedWatermarkModel.last_pushed_at, stmt.excluded.last_pushed_at),
+                "last_run_at": stmt.excluded.last_run_at,
+            },
+        )
+        if async_db is not None:
+            _ = await async_db.execute(stmt)
+        elif sync_db is not None:
+            _ = sync_db.execute(stmt)
+        else:
+            return None
+
+        return True
+    except Exception as e:
+        logger.error("Error saving seed watermarks", count=len(watermarks), error=e)
+        return None
+
+
+async def get_or_start_seed_run(async_db: AsyncSession | None = None, sync_db: Session | None = None) -> SeedRunModel | None:
+    """Get the latest unfinished seed run to resume it, or start a new one if all runs are finished,
+    if result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = select(SeedRunModel).where(SeedRunModel.finished_at.is_(None)).order_by(SeedRunModel.started_at.desc()).limit(1)
+        if async_db is not None:
+            run = (await async_db.scalars(statement=stmt)).first()
+            if run is None:
+                run = SeedRunModel()
+                async_db.add(run)
+                await async_db.commit()
+                await async_db.refresh(run)
+        elif sync_db is not None:
+            run = sync_db.scalars(statement=stmt).first()
+            if run is None:
+                run = SeedRunModel()
+                sync_db.add(run)
+                sync_db.commit()
+                sync_db.refresh(run)
+        else:
+            return None
+
+        return run
+    except Exception as e:
+        logger.error("Error getting or starting seed run", error=e)
+        return None
+
+async def get_seed_run_done_owners(run_id: UUID, async_db: AsyncSession | None = None, sync_db: Session | None = None) -> set[str] | None:
+    """Get usernames of the owners that are done in the seed run, if result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = select(SeedJournalEntryModel.owner_username).where(SeedJournalEntryModel.run_id == run_id)
+        if async_db is not None:
+            res = await async_db.scalars(statement=stmt)
+        elif sync_db is not None:
+            res = sync_db.scalars(statement=stmt)
+        else:
+            return None
+
+        return set(res.all())
+    except Exception as e:
+        logger.error("Error getting seed run's done owners", run_id=run_id, error=e)
+        return None
+
+async def add_seed_journal_entries(run_id: UUID, owners_usernames: list[str], async_db: AsyncSession | None = None, sync_db: Session | None = None) -> bool | None:
+    """Mark the owners as done in the seed run, if result is None then there was unknown error.
+    Note: it doesn't commit, and you have to pass async_db or sync_db, if you didn't it'll return None"""
+    if len(owners_usernames) == 0:
+        return True
+    try:
+        stmt = pg_insert(SeedJournalEntryModel).values([
+            {"run_id": run_id, "owner_username": owner_username} for owner_username in owners_usernames
+        ]).on_conflict_do_nothing()
+        if async_db is not None:
+            _ = await async_db.execute(stmt)
+        elif sync_db is not None:
+            _ = sync_db.execute(stmt)
+        else:
+            return None
+
+        return True
+    except Exception as e:
+        logger.error("Error adding seed journal entries", run_id=run_id, count=len(owners_usernames), error=e)
+        return None
+
+async def finish_seed_run(run_id: UUID, async_db: AsyncSession | None = None, sync_db: Session | None = None) -> bool | None:
+    """Mark the seed run as finished, and drop its journal as it's not needed anymore,
+    if result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        update_stmt = update(SeedRunModel).where(SeedRunModel.id == run_id).values(finished_at=func.now())
+        delete_stmt = delete(SeedJournalEntryModel).where(SeedJournalEntryModel.run_id == run_id)
+        if async_db is not None:
+            _ = await async_db.execute(update_stmt)
+            _ = await async_db.execute(delete_stmt)
+            await async_db.commit()
+        elif sync_db is not None:
+            _ = sync_db.execute(update_stmt)
+            _ = sync_db.execute(delete_stmt)
+            sync_db.commit()
+        else:
+            return None
+
+        return True
+    except Exception as e:
+        logger.error("Error finishing seed run", run_id=run_id, error=e)
+        return None
+
+
+async def get_imported_json_files_hashes(name_prefix: str, async_db: AsyncSession | None = None, sync_db: Session | None = None) -> dict[str, str] | None:
+    """Get the hashes of the imported JSON files {file_name: hash}, if result is None then there was unknown error.
+    Note: You have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = select(ImportedJSONFileModel.file_name, ImportedJSONFileModel.hash).where(ImportedJSONFileModel.name_prefix == name_prefix)
+        if async_db is not None:
+            res = await async_db.execute(stmt)
+        elif sync_db is not None:
+            res = sync_db.execute(stmt)
+        else:
+            return None
+
+        return {row.file_name: row.hash for row in res}
+    except Exception as e:
+        logger.error("Error getting imported JSON files' hashes", name_prefix=name_prefix, error=e)
+        return None
+
+async def upsert_imported_json_file(name_prefix: str, file_name: str, file_hash: str, async_db: AsyncSession | None = None, sync_db: Session | None = None) -> bool | None:
+    """Save the imported JSON file's hash, if result is None then there was unknown error.
+    Note: it doesn't commit, and you have to pass async_db or sync_db, if you didn't it'll return None"""
+    try:
+        stmt = pg_insert(ImportedJSONFileModel).values(name_prefix=name_prefix, file_name=file_name, hash=file_hash)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ImportedJSONFileModel.name_prefix, ImportedJSONFileModel.file_name],
+            set_={"hash": stmt.excluded.hash, "imported_at": func.now()},
+        )
+        if async_db is not None:
+            _ = await async_db.execute(stmt)
+        elif sync_db is not None:
+            _ = sync_db.execute(stmt)
+        else:
+            return None
+
+        return True
+    except Exception as e:
+        logger.error("Error saving imported JSON file's hash", name_prefix=name_prefix, file_name=file_name, error=e)
+        return None
@@ -1,10 +1,16 @@
-from typing import Any
-from sqlalchemy.engine import URL , create_engine
+from typing import Any, TypedDict, TypeVar
+import time
+from fastapi import Request, Response
+from sqlalchemy import event, inspect, exc, QueuePool
+from sqlalchemy.engine import URL , create_engine, Connection, Engine
+from sqlalchemy.orm import ORMExecuteState
 from sqlalchemy.orm.session import Session, sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
-from collections.abc import AsyncGenerator, Generator
+from collections.abc import AsyncGenerator, Generator, Callable, Awaitable
 #####
-from oss_archive.config import DB
+from oss_archive.config import DB, DBPool, BackgroundDBPool, DBReplica, DatabasePoolConfigType
+from oss_archive.database.models import Base
+from oss_archive.utils.logger import logger
 
 db_url = URL.create(
     drivername="postgresql+psycopg",
@@ -15,21 +21,67 @@ db_url = URL.create(
     port=DB.get('port')
 )
 
+replica_db_url = db_url.set(host=DBReplica.get("host"), port=DBReplica.get("port")) if DBReplica.get("host") is not None else None
 
-async_engine: AsyncEngine = create_async_engine(db_url)
+
+def __get_pool_options(pool_config: DatabasePoolConfigType) -> dict[str, Any]:
+    return {
+        "pool_size": pool_config.get("size"),
+        "max_overflow": pool_config.get("max_overflow"),
+        "pool_timeout": pool_config.get("timeout"),
+        "pool_pre_ping": pool_config.get("pre_ping"),
+        "pool_recycle": pool_config.get("recycle"),
+    }
+
+# For API requests
+async_engine: AsyncEngine = create_async_engine(db_url, **__get_pool_options(DBPool))
+# For background work, like seeding, importing & exporting json-archives, so it never uses the API's connections.
+background_async_engine: AsyncEngine = create_async_engine(db_url, **__get_pool_options(BackgroundDBPool))
+
+# The replica's engines, with the same pools' budgets of the primary's ones, or None if there's no replica.
+replica_async_engine: AsyncEngine | None = create_async_engine(replica_db_url, **__get_pool_options(DBPool)) if replica_db_url is not None else None
+replica_background_async_engine: AsyncEngine | None = create_async_engine(replica_db_url, **__get_pool_options(BackgroundDBPool)) if replica_db_url is not None else None
 
 AsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(autocommit=False, autoflush=False, bind=async_engine)
+ReadOnlyAsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(autocommit=False, autoflush=False, bind=replica_async_engine or async_engine)
 
 # FastAPI's dependency with yield: https://fastapi.tiangolo.com/tutorial/dependencies/dependencies-with-yield/
-async def get_async_db() -> AsyncGenerator[AsyncSession, Any]:
+async def get_async_db(response: Response) -> AsyncGenerator[AsyncSession, Any]:
     db: AsyncSession = AsyncSessionLocal()
+    db.info["response"] = response # so its client is pinned to the primary after it writes
     try:
         yield db
     finally:
         await db.close()
 
+# For background work like seeding, that uses its objects across many commits,
+# so they aren't expired on commit, as AsyncSession can't lazy load them again.
+BackgroundAsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=background_async_engine)
 
-sync_engine = create_engine(db_url)
+ReadOnlyBackgroundAsyncSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_background_async_engine or background_async_engine)
+
+# For read-only endpoints (listing, getting by id/key...etc), they're sent to the replica if there's one,
+# unless the client wrote something in the last DBReplica.pin_seconds, then it's sent to the primary, so it reads its own writes.
+async def get_read_only_async_db(request: Request) -> AsyncGenerator[AsyncSession, Any]:
+    db: AsyncSession = AsyncSessionLocal() if __is_client_pinned(request) else ReadOnlyAsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+# For long read-only work, like exporting json-archives.
+# Note: a hot standby cancels long queries that conflict with replaying the primary's changes (like rows removed by VACUUM),
+# so run it with retry_on_primary(), or set hot_standby_feedback = on (or a bigger max_standby_streaming_delay) on the replica.
+async def get_read_only_background_async_db(request: Request) -> AsyncGenerator[AsyncSession, Any]:
+    db: AsyncSession = BackgroundAsyncSessionLocal() if __is_client_pinned(request) else ReadOnlyBackgroundAsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# For scripts & background work too.
+sync_engine = create_engine(db_url, **__get_pool_options(BackgroundDBPool))
 
 SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
 
@@ -40,3 +92,162 @@ def get_sync_db() -> Generator[Session, Any]:
         yield db
     finally:
         db.close()
+
+
+
+# Read-your-writes: after a client's write is committed, the response tells it till when its reads go to the primary,
+# by a cookie and a header (for clients that don't keep cookies, they send it back as a header), so it works with many workers.
+PINNED_UNTIL_COOKIE = "db_pinned_until"
+PINNED_UNTIL_HEADER = "X-DB-Pinned-Until"
+
+def __is_client_pinned(request: Request) -> bool:
+    if replica_async_engine is None:
+        return True # everything goes to the primary anyway
+    pinned_until = request.headers.get(PINNED_UNTIL_HEADER) or request.cookies.get(PINNED_UNTIL_COOKIE)
+    try:
+        return pinned_until is not None and float(pinned_until) > time.time()
+    except ValueError:
+        return False
+
+def __pin_client(response: Response):
+    pin_seconds = DBReplica.get("pin_seconds")
+    pinned_until = str(round(time.time() + pin_seconds, 3))
+    response.headers[PINNED_UNTIL_HEADER] = pinned_until
+    response.set_cookie(PINNED_UNTIL_COOKIE, pinned_until, max_age=max(int(pin_seconds), 1), httponly=True, samesite="lax")
+
+ResultType = TypeVar("ResultType")
+
+def __is_replica_conflict(db: AsyncSession, error: exc.OperationalError) -> bool:
+    if replica_background_async_engine is None or db.bind is not replica_background_async_engine:
+        return False
+    # serialization_failure is used for "canceling statement due to conflict with recovery", and deadlock_detected for buffer pin deadlocks.
+    return getattr(error.orig, "sqlstate", None) in ("40001", "40P01")
+
+async def retry_on_primary(db: AsyncSession, work: Callable[[AsyncSession], Awaitable[ResultType]]) -> ResultType:
+    """Run the work with the read-only background session, if the replica cancels its query for a conflict with recovery
+    (replaying the primary's changes while it's running), it's run again from the start on the primary."""
+    try:
+        return await work(db)
+    except exc.OperationalError as e:
+        if not __is_replica_conflict(db, e):
+            raise
+        logger.warning("The replica cancelled the query, retrying on the primary", error=e)
+        async with BackgroundAsyncSessionLocal() as primary_db:
+            return await work(primary_db)
+
+
+# Tables written by sessions, collected till their commit, then the callbacks are called with them (like forgetting their cached counts).
+__committed_writes_callbacks: list[Callable[[set[str]], None]] = []
+
+def on_committed_writes(callback: Callable[[set[str]], None]):
+    """Call the callback with the written tables' names, after every commit of a session that wrote something
+    (by ORM objects or INSERT/UPDATE/DELETE statements)."""
+    __committed_writes_callbacks.append(callback)
+
+def __add_written_tables(session: Session, tables: list[Any]):
+    written_tables: set[str] = session.info.setdefault("written_tables", set())
+    written_tables.update(table.name for table in tables if getattr(table, "name", None) is not None)
+
+@event.listens_for(Session, "do_orm_execute")
+def __on_orm_execute(orm_execute_state: ORMExecuteState):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        __add_written_tables(orm_execute_state.session, [getattr(orm_execute_state.statement, "table", None)])
+
+@event.listens_for(Session, "after_flush")
+def __on_flush(session: Session, _flush_context: Any):
+    for instance in [*session.new, *session.dirty, *session.deleted]:
+        __add_written_tables(session, list(inspect(instance).mapper.tables))
+
+@event.listens_for(Session, "after_commit")
+def __on_commit(session: Session):
+    written_tables: set[str] = session.info.pop("written_tables", set())
+    if len(written_tables) == 0:
+        return
+    response = session.info.get("response")
+    if response is not None:
+        __pin_client(response)
+    for callback in __committed_writes_callbacks:
+        callback(written_tables)
+
+@event.listens_for(Session, "after_rollback")
+def __on_rollback(session: Session):
+    _ = session.info.pop("written_tables", None)
+
+
+class PoolStatsType(TypedDict):
+    name: str
+    size: int
+    max_overflow: int
+    checked_in: int # idle connections in the pool
+    checked_out: int # connections being used
+    overflow: int # connections opened over the size, it's negative while the pool isn't full yet
+    connections_opened: int # since the app started, a lot of them means connections are closed & opened again (like by recycle or pre_ping)
+    checkouts: int # since the app started
+    invalidated: int # since the app started, connections that were found broken
+
+__pools: dict[str, tuple[Engine, DatabasePoolConfigType]] = {}
+__pools_counters: dict[str, dict[str, int]] = {}
+
+def __instrument_pool(name: str, engine: Engine, pool_config: DatabasePoolConfigType):
+    counters = {"connections_opened": 0, "checkouts": 0, "invalidated": 0}
+    __pools[name] = (engine, pool_config)
+    __pools_counters[name] = counters
+
+    def on_connect(*_: Any):
+        counters["connections_opened"] += 1
+    def on_checkout(*_: Any):
+        counters["checkouts"] += 1
+    def on_invalidate(*_: Any):
+        counters["invalidated"] += 1
+
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "invalidate", on_invalidate)
+
+__instrument_pool("api", async_engine.sync_engine, DBPool)
+__instrument_pool("background", background_async_engine.sync_engine, BackgroundDBPool)
+__instrument_pool("sync", sync_engine, BackgroundDBPool)
+if replica_async_engine is not None and replica_background_async_engine is not None:
+    __instrument_pool("replica", replica_async_engine.sync_engine, DBPool)
+    __instrument_pool("replica_background", replica_background_async_engine.sync_engine, BackgroundDBPool)
+
+def get_pools_stats() -> list[PoolStatsType]:
+    stats: list[PoolStatsType] = []
+    for name, (engine, pool_config) in __pools.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        counters = __pools_counters[name]
+        stats.append(PoolStatsType(
+            name=name,
+            size=pool.size(),
+            max_overflow=pool_config.get("max_overflow"),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            connections_opened=counters["connections_opened"],
+            checkouts=counters["checkouts"],
+            invalidated=counters["invalidated"],
+        ))
+    return stats
+
+async def dispose_engines():
+    """Close all pools' connections, when the app stops."""
+    await async_engine.dispose()
+    await background_async_engine.dispose()
+    if replica_async_engine is not None:
+        await replica_async_engine.dispose()
+    if replica_background_async_engine is not None:
+        await replica_background_async_engine.dispose()
+    sync_engine.dispose()
+
+
+def create_missing_indexes(connection: Connection):
+    """create_all only creates the indexes of the tables it creates,
+    so the indexes added to existing tables are created here, use it with AsyncConnection.run_sync().
+
+    Note: CREATE INDEX blocks writes on the table till it's done,
+    for a big table, create the index first with CREATE INDEX CONCURRENTLY (using the same name), then it's skipped here."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
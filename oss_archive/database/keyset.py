@@ -0,0 +1,73 @@
+"""Keyset (cursor) pagination for listings, instead of OFFSET that gets slower the deeper the page is,
+as the database still has to go through all the skipped rows.
+
+A listing is ordered by a tuple of columns that ends with a unique one, like (priority, fullname),
+then the next page is the rows after the last row's tuple: WHERE (priority, fullname) > (:priority, :fullname),
+which is a single range scan on the tuple's index, and stays stable while rows are inserted or deleted.
+
+The cursor is the last row's tuple, encoded as an opaque base64 string, so clients just send back the next_cursor they got."""
+from typing import Any, Literal
+from collections.abc import Sequence
+from datetime import datetime
+import base64
+import json
+from sqlalchemy import Select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql.sqltypes import DateTime
+
+SortColumnsType = tuple[InstrumentedAttribute[Any], ...]
+
+
+def __encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def __decode_value(column: InstrumentedAttribute[Any], value: Any) -> Any:
+    """Check the value against its column's type, so a crafted cursor never reaches the database."""
+    if isinstance(column.type, DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    # bool is an int in python, but it's not a valid value of an int column.
+    if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+        raise ValueError("Invalid cursor")
+    return value
+
+def encode_cursor(order_by: str, order: Literal["asc", "desc"], columns: SortColumnsType, row: Any) -> str:
+    """Encode the row's sort tuple, with the order it's for, so a cursor can't be used with another order."""
+    cursor = {"order_by": order_by, "order": order, "values": [__encode_value(getattr(row, column.key)) for column in columns]}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def decode_cursor(cursor: str, order_by: str, order: Literal["asc", "desc"], columns: SortColumnsType) -> tuple[Any, ...]:
+    """Get the sort tuple of the cursor, it raises ValueError if it's invalid or it's for another order."""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = decoded["values"]
+        if decoded["order_by"] != order_by or decoded["order"] != order or len(values) != len(columns):
+            raise ValueError("The cursor is for another order")
+        return tuple(__decode_value(column, value) for column, value in zip(columns, values))
+    except (KeyError, TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def paginate(stmt: Select[Any], columns: SortColumnsType, order: Literal["asc", "desc"], limit: int, after: tuple[Any, ...] | None = None) -> Select[Any]:
+    """Order the statement by the columns, and get the page after the sort tuple.
+    It gets one more row than the limit, to know if there's a next page (see get_page)."""
+    if after is not None:
+        keyset = tuple_(*columns)
+        stmt = stmt.where(keyset > tuple_(*after) if order == "asc" else keyset < tuple_(*after))
+    order_by = [column.asc() if order == "asc" else column.desc() for column in columns]
+    return stmt.order_by(*order_by).limit(limit + 1)
+
+def get_page(rows: Sequence[Any], order_by: str, order: Literal["asc", "desc"], columns: SortColumnsType, limit: int) -> tuple[Sequence[Any], str | None]:
+    """Get the page's rows, and the cursor of the next page, or None if it's the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(order_by, order, columns, page[-1])
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship, validates
-from sqlalchemy import Table, Column, DateTime, Enum, ARRAY, String, text, SmallInteger, Boolean, ForeignKey
+from sqlalchemy import Table, Column, Index, DateTime, Enum, ARRAY, String, text, SmallInteger, Boolean, ForeignKey
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from uuid import UUID
@@ -37,12 +37,19 @@ categories_oss_table = Table(
     Base.metadata,
     Column("main_category_key", ForeignKey("categories.key")),
     Column("oss_id", ForeignKey("oss_table.id")),
+    # Both ways of the relation, a category's related OSS, and an OSS's related categories.
+    Index("ix_categories_oss_table_main_category_key_oss_id", "main_category_key", "oss_id"),
+    Index("ix_categories_oss_table_oss_id", "oss_id"),
 )
 
 
 # Tables
 class Category(PriorityField, Base):
     __tablename__: str = "categories"
+    __table_args__: tuple[Index, ...] = (
+        Index("ix_categories_priority_key", "priority", "key"), # listing & exporting order
+        Index("ix_categories_updated_at_key", "updated_at", "key"), # listing by last update
+    )
     key: Mapped[str] = mapped_column(String(length=128), primary_key=True, nullable=False)
     name: Mapped[str | None] = mapped_column(String(length=256), nullable=True)
     description:  Mapped[str | None] = mapped_column(String(length=512), nullable=True)
@@ -60,6 +67,11 @@ class Category(PriorityField, Base):
 
 class Owner(PriorityField, Base):
     __tablename__: str = "owners"
+    __table_args__: tuple[Index, ...] = (
+        Index("ix_owners_priority_username", "priority", "username"), # listing & exporting order
+        Index("ix_owners_updated_at_username", "updated_at", "username"), # listing by last update
+        Index("ix_owners_main_category_key_priority", "main_category_key", "priority"), # a category's owners, by priority
+    )
 
     id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), server_default=text("gen_random_uuid()"), primary_key=True, nullable=False)
     username: Mapped[str] = mapped_column(String(length=256), unique=True, nullable=False)
@@ -84,6 +96,15 @@ class Owner(PriorityField, Base):
 
 class OSS(PriorityField, Base):
     __tablename__: str = "oss_table"
+    # The FKs' indexes have priority after them, as OSS are always listed by priority,
+    # so filtering and ordering are both done by the index, without sorting.
+    __table_args__: tuple[Index, ...] = (
+        Index("ix_oss_table_priority_fullname", "priority", "fullname"), # listing & exporting order
+        Index("ix_oss_table_updated_at_fullname", "updated_at", "fullname"), # listing by last update
+        Index("ix_oss_table_main_category_key_priority", "main_category_key", "priority"), # a category's OSS
+        Index("ix_oss_table_owner_username_priority", "owner_username", "priority"), # an owner's OSS
+        Index("ix_oss_table_is_mirrored_priority", "is_mirrored", "priority"), # the next OSS to mirror
+    )
     id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), server_default=text("gen_random_uuid()"), primary_key=True, nullable=False)
     repo_name: Mapped[str] = mapped_column(String(length=256), nullable=False)
     fullname: Mapped[str] = mapped_column(String(length=512), unique=True, nullable=False)
@@ -106,3 +127,32 @@ class OSS(PriorityField, Base):
 
     owner_username: Mapped[str] = mapped_column(ForeignKey("owners.username"), nullable=False)
     owner: Mapped[Owner] = relationship(back_populates="owned_oss")
+
+class SeedWatermark(Base):
+    """Where the last seeding of the owner's OSS stopped, so the next one only gets the repos that changed after it."""
+    __tablename__: str = "seed_watermarks"
+    owner_username: Mapped[str] = mapped_column(ForeignKey("owners.username"), primary_key=True, nullable=False)
+    last_pushed_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True) # the latest pushed_at (Github) or updated_at (Forgejo) of the owner's repos
+    last_run_at: Mapped[datetime] = mapped_column(DateTime(), server_default=text("CURRENT_TIMESTAMP"))
+
+class SeedRun(Base):
+    """A run of seeding owners' OSS, if it's not finished (like the app stopped during it), the next run resumes it."""
+    __tablename__: str = "seed_runs"
+    id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), server_default=text("gen_random_uuid()"), primary_key=True, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime(), server_default=text("CURRENT_TIMESTAMP"))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+
+class SeedJournalEntry(Base):
+    """An owner that its OSS are all written in the seed run, so resuming the run skips it."""
+    __tablename__: str = "seed_journal"
+    run_id: Mapped[UUID] = mapped_column(ForeignKey("seed_runs.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    owner_username: Mapped[str] = mapped_column(ForeignKey("owners.username"), primary_key=True, nullable=False)
+    done_at: Mapped[datetime] = mapped_column(DateTime(), server_default=text("CURRENT_TIMESTAMP"))
+
+class ImportedJSONFile(Base):
+    """A json-archive file that its items are imported, with its content's hash, so it's skipped by the next imports if it didn't change."""
+    __tablename__: str = "imported_json_files"
+    name_prefix: Mapped[str] = mapped_column(String(length=128), primary_key=True, nullable=False)
+    file_name: Mapped[str] = mapped_column(String(length=256), primary_key=True, nullable=False)
+    hash: Mapped[str] = mapped_column(String(length=64), nullable=False)
+    imported_at: Mapped[datetime] = mapped_column(DateTime(), server_default=text("CURRENT_TIMESTAMP"), onupdate=text("CURRENT_TIMESTAMP"))
@@ -1,28 +1,38 @@
-from fastapi import FastAPI, status, Depends, HTTPException
+from fastapi import FastAPI, status, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
-from sqlalchemy.orm import Session
+import asyncio
 from scalar_fastapi import get_scalar_api_reference # pyright:ignore[reportMissingTypeStubs]
-from typing import Annotated
 ###
+from oss_archive.config import Forgejo
 from oss_archive.utils.logger import logger
+from oss_archive.utils import httpx
 # Database
-from oss_archive.database.index import get_sync_db, async_engine
+from oss_archive.database.index import async_engine, create_missing_indexes, get_pools_stats, dispose_engines
 from oss_archive.database.models import Base
-from oss_archive.seeders.index import seed_owners_oss
+from oss_archive.seeders.sources import github as github_source, codeberg as codeberg_source
 # Components
 from oss_archive.components.forgejo.router import router as forgejo_router
 from oss_archive.components.categories.router import router as categories_router
 from oss_archive.components.owners.router import router as owners_router
 from oss_archive.components.oss.router import router as oss_router
+from oss_archive.components.seed.router import router as seed_router
+from oss_archive.components.seed.jobs import cancel_jobs as cancel_seed_jobs, start_job as start_seed_job, get_running_job as get_running_seed_job
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with async_engine.begin() as connection:
         await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(create_missing_indexes)
+    # Open pooled HTTP clients for the upstream hosts, so their connections are reused between requests.
+    httpx.open_clients([Forgejo.get("base_url") or "", github_source.API_BASE_URL, codeberg_source.API_BASE_URL])
     yield
+    # Running seed jobs are journaled, so the next one resumes them.
+    await cancel_seed_jobs()
+    await httpx.close_clients()
+    await dispose_engines()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -75,23 +85,35 @@ async def scalar_html() :
         title=app.title,
     )
 
+# It waits till seeding finishes, use POST /seed/jobs to seed in the background and follow its progress.
+# It's a seed job too, so it never runs at the same time as another one (they would resume the same journal).
 @app.get("/seed", status_code=status.HTTP_200_OK)
-async def seed_database(db: Annotated[Session, Depends(dependency=get_sync_db)]):
-# async def seed_database(db: Annotated[Session, Depends(dependency=get_sync_db)]):
-    try:
-        # Maybe we can add query params to skip what we want
-        _ = await seed_owners_oss(db)
-        return {"message": "Seedded The Database Successfully"}
-    except Exception as e:
-        logger.error("Seeding failure", error=e)
+async def seed_database():
+    # Maybe we can add query params to skip what we want
+    job = await start_seed_job()
+    if job is None or job.task is None:
+        running_job = get_running_seed_job()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"There's a seed job running already: {running_job.id if running_job is not None else 'in another worker'}")
+
+    # Shielded, so the job keeps running if the client disconnects, like the jobs started by POST /seed/jobs.
+    await asyncio.shield(job.task)
+    if job.status != "succeeded":
+        logger.error("Seeding failure", job_id=job.id, error=job.error)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Seeding operation has failed")
+    return {"message": "Seedded The Database Successfully"}
 
 @app.get("/ping")
 async def ping():    
     return {"message": "pong"}
 
+# The database's connections' pools, the API's one, and the background work's ones.
+@app.get("/db/pools", status_code=status.HTTP_200_OK)
+async def db_pools():
+    return {"pools": get_pools_stats()}
+
 
 ### Adding API routes
+app.include_router(seed_router)
 app.include_router(forgejo_router, prefix="/api")
 app.include_router(categories_router, prefix="/api")
 app.include_router(owners_router, prefix="/api")
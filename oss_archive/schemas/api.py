@@ -13,8 +13,13 @@ class SharedQueriesForGetAllRequests(BaseModel):
     model_config = {"extra": "forbid"} # Forbid adding other queries
 
     limit: Annotated[int, Field(default=100, gt=0, le=100)]
-    offset: Annotated[int, Field(default=0, ge=0)]
-    # order_by: Annotated[Literal["created_at", "updated_at"] | None, Field(default=None)]
+    offset: Annotated[int, Field(default=0, ge=0)] # ignored if there's a cursor, prefer the cursor for walking through all pages
+    # Sorted by the field, then by the entity's key (key, username or fullname), which is the only sort if it's "key".
+    order_by: Annotated[Literal["priority", "key", "updated_at"], Field(default="priority")]
+    order: Annotated[Literal["asc", "desc"], Field(default="asc")]
+    cursor: Annotated[str | None, Field(default=None)] # the next_cursor of the previous page
+    # how total_count is counted, the configured one by default (see database/counts)
+    count: Annotated[Literal["exact", "estimated", "cached", "none"] | None, Field(default=None)]
     # tags: Annotated[list[str] | None, Field(default=None)] # multiple query values
 
 
@@ -25,9 +30,18 @@ class GetAll_Res(BaseModel, Generic[DataType]):
     total_count: Annotated[int | None, Field(default=None)]
     offset: Annotated[int, Field()]
     limit: Annotated[int, Field()]
+    next_cursor: Annotated[str | None, Field(default=None)] # None if it's the last page
 
 class Update_Res(BaseModel):
     pass
 
 class Delete_Res(BaseModel):
     pass
+
+class VerifyJSON_Res(BaseModel):
+    name_prefix: Annotated[str, Field()]
+    is_valid: Annotated[bool, Field()]
+    checked_count: Annotated[int, Field()]
+    missing: Annotated[list[str], Field()]
+    mismatched: Annotated[list[str], Field()]
+    unlisted: Annotated[list[str], Field()]
@@ -0,0 +1,75 @@
+"""Writing seeded OSS in batches, every batch is a single INSERT ... ON CONFLICT (fullname) statement and a single commit,
+instead of (SELECT exists, INSERT, COMMIT) for every OSS."""
+from typing import Literal
+from sqlalchemy.ext.asyncio import AsyncSession
+###
+from oss_archive.utils.logger import logger
+from oss_archive.database.models import OSS as OSSModel
+from oss_archive.database import helpers as db_helpers
+
+
+class OSSBatchWriter():
+    """Collects OSS till there are {batch_size} of them, then writes them at once.
+    Call flush() after adding the last OSS, to write what's left of them.
+
+    An owner is done when all of its OSS are written, then it's in done_owners till they're taken by pop_done_owners(),
+    so the caller can mark owners as seeded (like saving their watermarks) only after their OSS are in the database.
+
+    OSS with the same fullname in a batch are written once (the last added one wins),
+    as Postgres can't update the same row twice in a single statement."""
+    def __init__(self, db: AsyncSession, batch_size: int = 500, on_conflict: Literal["nothing", "update"] = "nothing"):
+        self.db: AsyncSession = db
+        self.batch_size: int = max(batch_size, 1)
+        self.on_conflict: Literal["nothing", "update"] = on_conflict
+        self.new_fullnames: set[str] = set() # fullnames of the OSS inserted so far
+        self.written_count: int = 0 # OSS upserted so far, new or already existing
+        self.failed_count: int = 0 # OSS in batches that couldn't be written
+        self.done_owners: list[str] = []
+        self.__batch: dict[str, OSSModel] = {}
+        self.__pending_owners: list[str] = [] # owners added since the last flush
+        self.__failed_owners: set[str] = set() # owners with OSS in batches that couldn't be written
+
+    async def add(self, owner_username: str, oss_list: list[OSSModel]):
+        """Add all OSS of the owner."""
+        for oss in oss_list:
+            self.__batch[oss.fullname] = oss
+            if len(self.__batch) >= self.batch_size:
+                _ = await self.flush()
+        self.__pending_owners.append(owner_username)
+        if len(self.__batch) == 0: # all of its OSS are already written
+            _ = await self.flush()
+
+    def pop_done_owners(self) -> list[str]:
+        done_owners = self.done_owners
+        self.done_owners = []
+        return done_owners
+
+    async def flush(self) -> set[str] | None:
+        """Write the current batch, and return the fullnames of its new OSS, or None if it couldn't be written."""
+        if len(self.__batch) == 0:
+            self.__mark_pending_owners_done()
+            return set()
+
+        batch = list(self.__batch.values())
+        self.__batch = {}
+        try:
+            new_fullnames = await db_helpers.upsert_oss_list(batch, on_conflict=self.on_conflict, async_db=self.db)
+            if new_fullnames is None:
+                raise Exception("Couldn't upsert the OSS batch")
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            self.failed_count += len(batch)
+            self.__failed_owners.update(oss.owner_username for oss in batch)
+            logger.error("Unknown Error when writing OSS batch", count=len(batch), error=e)
+            return None
+
+        self.new_fullnames.update(new_fullnames)
+        self.written_count += len(batch)
+        self.__mark_pending_owners_done()
+        logger.info("Wrote OSS batch", count=len(batch), new_count=len(new_fullnames))
+        return new_fullnames
+
+    def __mark_pending_owners_done(self):
+        self.done_owners.extend(owner for owner in self.__pending_owners if owner not in self.__failed_owners)
+        self.__pending_owners = []
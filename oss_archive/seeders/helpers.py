@@ -1,3 +1,5 @@
+from typing import Any
+from datetime import datetime, timezone
 ### 
 from oss_archive.utils.logger import logger
 from oss_archive.database.models import OSS as OSSModel, Owner as OwnerModel, Category as CategoryModel
@@ -22,3 +24,29 @@ def should_apply_action_on_oss(owner: OwnerModel, repo_name: str | None)-> bool:
     
     return should_download
 
+
+
+def parse_source_datetime(value: Any) -> datetime | None:
+    """Parse a source's ISO-8601 timestamp (like "2024-05-01T10:00:00Z") to a naive UTC datetime, as we store them."""
+    if type(value) is not str:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def get_repos_watermark(repos: list[dict[str, Any]], field: str, since: datetime | None = None) -> datetime | None:
+    """Get the latest {field} timestamp of the repos, and not older than the previous watermark (since)."""
+    watermark = since
+    for repo in repos:
+        changed_at = parse_source_datetime(repo.get(field))
+        if changed_at is not None and (watermark is None or changed_at > watermark):
+            watermark = changed_at
+    return watermark
+
+def is_repo_changed_since(repo: dict[str, Any], field: str, since: datetime) -> bool:
+    changed_at = parse_source_datetime(repo.get(field))
+    return changed_at is not None and changed_at > since
@@ -1,20 +1,20 @@
-from sqlalchemy.orm import Session
-from time import sleep
+from sqlalchemy.ext.asyncio import AsyncSession
 ###
 from oss_archive.config import ENV
 from oss_archive.utils.logger import logger
 from oss_archive.database.models import Category as CategoryModel, Owner as OwnerModel, OSS as OSSModel
 from oss_archive.database import helpers as db_helpers
 from oss_archive.seeders.json import seed_json
-from oss_archive.seeders.sources import github as github_source, codeberg as codeberg_source
+from oss_archive.seeders import pipeline
+from oss_archive.seeders.progress import SeedProgress
 from oss_archive.seeders.forgejo import create_org_for_mirrors
 
-async def seed(db: Session):
+async def seed(db: AsyncSession):
     ### Make requests to outer APIs async, but the seeding operation can by sync
     # Steps:
     # 1 - We seed data in json-archive first to the database
     # _ = await seed_json(db)   
-    # 2 -  Pull owners and start using each item to seed OSS into oss_table    
+    # 2 -  Pull owners and start using each item to seed OSS into oss_table, the run is journaled so a stopped one is resumed (see seeders/pipeline)
     # _ = await seed_owners_oss(db)
 
     # 3 - After that we should create "mirrors" user in forgejo if it doesn't exist
@@ -27,30 +27,19 @@ async def seed(db: Session):
     return
 
 
-async def seed_owners_oss(db: Session):
-    owners = await db_helpers.get_all_owners(sync_db=db)
-    if owners is None or len(owners) == 0:
+async def seed_owners_oss(db: AsyncSession, progress: SeedProgress | None = None):
+    owners = await db_helpers.get_all_owners(async_db=db)
+    if owners is None:
+        raise Exception("Couldn't get owners to seed their OSS")
+    if len(owners) == 0:
         return
 
-    for owner in owners:
+    # So that we limit owners seeded while testing.
+    if ENV == "dev":
+        owners = [owner for owner in owners if owner.main_category_key in ["ai", "prog_awe"]]
 
-        # So that we limit owners seeded while testing.
-        if ENV == "dev" and owner.main_category_key not in ["ai", "prog_awe"]:
-            continue
-        
-        logger.info(f"Owner is in {owner.main_category}")
-        _ = await seed_owner_oss_from_source(owner, db)
-        # Sleep 0.5 seconds to prevent source's rate-limit
-        sleep(0.5)
+    # Requests are paced by the source's rate limiter in utils/httpx, using the rate-limit headers it reports.
+    new_oss_count = await pipeline.seed_owners_oss(owners, db, progress)
+    if new_oss_count is None:
+        raise Exception("Couldn't start the seed run")
     return
-
-async def seed_owner_oss_from_source(owner: OwnerModel, db: Session): #-> Owner:
-    match owner.source:
-        case "github":
-            return await github_source.seed_owner_oss(owner, db)
-        case "codeberg":
-            return await codeberg_source.seed_owner_oss(owner, db)
-        # Defualt None value for unknown sources.
-        case _:
-            logger.error("Unkown OSS source", owner=owner)
-            return None
@@ -1,58 +1,87 @@
-from sqlalchemy.orm import Session
+from typing import Any
+import asyncio
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 ###
-from oss_archive.database.models import Category as CategoryModel, Owner as OwnerModel, OSS as OSSModel
+from oss_archive.database.models import Base, Category as CategoryModel, Owner as OwnerModel, OSS as OSSModel
 from oss_archive.database import helpers as db_helpers
 from oss_archive.utils import json as json_utils
 from oss_archive.utils.logger import logger
 
 
-async def seed_json(db: Session):
-    await seed_categories_json_files(db)
-    await seed_owners_json_files(db)
-    await seed_oss_json_files(db)
+async def seed_json(db: AsyncSession, only_changed: bool = True):
+    """Import the json-archive, if only_changed is True, the files that didn't change since their last import are skipped."""
+    # Order matters, as owners & OSS reference categories, and OSS reference owners.
+    await seed_categories_json_files(db, only_changed)
+    await seed_owners_json_files(db, only_changed)
+    await seed_oss_json_files(db, only_changed)
 
     return
 
-async def seed_categories_json_files(db: Session):
-    for file in json_utils.get_json_files(json_utils.CategoriesJSONFileConfig):
-        file_data = json_utils.get_json_file_data(json_utils.CategoriesJSONFileConfig, file)
-        if file_data is None:
-            continue
-        for item in file_data.items:
-            new_category = CategoryModel(**item)
+async def seed_categories_json_files(db: AsyncSession, only_changed: bool = True):
+    return await __seed_json_files(db, json_utils.CategoriesJSONFileConfig, CategoryModel, CategoryModel.key, only_changed)
 
-            does_exist = await db_helpers.does_category_exists(new_category.key, sync_db=db)
-            if does_exist is False:
-                _ = db.add(new_category)
-            
-            db.commit()
+async def seed_owners_json_files(db: AsyncSession, only_changed: bool = True):
+    return await __seed_json_files(db, json_utils.OwnersJSONFileConfig, OwnerModel, OwnerModel.username, only_changed)
 
+async def seed_oss_json_files(db: AsyncSession, only_changed: bool = True):
+    return await __seed_json_files(db, json_utils.OSSJSONFileConfig, OSSModel, OSSModel.fullname, only_changed)
 
-async def seed_owners_json_files(db: Session):
-    for file in json_utils.get_json_files(json_utils.OwnersJSONFileConfig):
-        file_data = json_utils.get_json_file_data(json_utils.OwnersJSONFileConfig, file)
-        if file_data is None:
-            continue
-        for item in file_data.items:
-            new_owner = OwnerModel(**item)
 
-            does_exist = await db_helpers.does_owner_exists(new_owner.username, sync_db=db)
-            if does_exist is False:
-                _ = db.add(new_owner)
-            
-            db.commit()
+async def __seed_json_files(db: AsyncSession, config: json_utils.JSONFileConfigType, model: type[Base], key_column: InstrumentedAttribute[str], only_changed: bool) -> int:
+    """Insert the new items of the JSON files, and return their count.
+    The existing keys are got at once, so the new items are known in memory,
+    then every file's new items are inserted by a multi-row INSERT in a single transaction, with the file's hash.
+
+    Files' hashes are compared to the ones saved by their last import, so the unchanged files are skipped without parsing them."""
+    name_prefix = config.get("name_prefix")
+    files = json_utils.get_json_files(config)
+    # Hashing in a thread, so it doesn't block the event loop.
+    files_hashes = await asyncio.to_thread(lambda: {file: json_utils.get_file_hash(config.get("json_dir") + file) for file in files})
+    if only_changed:
+        imported_hashes = await db_helpers.get_imported_json_files_hashes(name_prefix, async_db=db)
+        if imported_hashes is None:
+            logger.error("Couldn't get imported JSON files' hashes, so all files are imported", name_prefix=name_prefix)
+            imported_hashes = {}
+        files = [file for file in files if files_hashes.get(file) is None or files_hashes.get(file) != imported_hashes.get(file)]
+        logger.info("Importing changed JSON files", name_prefix=name_prefix, files_count=len(files), skipped_count=len(files_hashes) - len(files))
+    if len(files) == 0:
+        return 0
 
-async def seed_oss_json_files(db: Session):
-    for file in json_utils.get_json_files(json_utils.OSSJSONFileConfig):
-        file_data = json_utils.get_json_file_data(json_utils.OSSJSONFileConfig, file)
+    existing_keys = await db_helpers.get_all_keys(key_column, async_db=db)
+    if existing_keys is None:
+        logger.error("Couldn't get existing keys, so JSON files aren't seeded", name_prefix=config.get("name_prefix"))
+        return 0
+
+    new_items_count = 0
+    # Files are parsed in a pool of processes, while the parsed ones are inserted.
+    async for file, file_data in json_utils.iter_json_files_data(config, files):
         if file_data is None:
             continue
+        file_hash = files_hashes.get(file)
+
+        new_items: list[dict[str, Any]] = []
         for item in file_data.items:
-            new_oss = OSSModel(**item)
+            key = item.get(key_column.key)
+            if key is None or key in existing_keys:
+                continue
+            existing_keys.add(key) # so it isn't inserted twice if it's in 2 files
+            new_items.append(item)
 
-            does_exist = await db_helpers.does_oss_exists(new_oss.fullname, sync_db=db)
-            if does_exist is False:
-                db.add(new_oss)
-                
-            db.commit()
+        try:
+            if len(new_items) > 0:
+                # ON CONFLICT DO NOTHING, in case another writer inserted one of them after we got the existing keys.
+                _ = await db.execute(pg_insert(model).on_conflict_do_nothing(), new_items)
+            if file_hash is not None:
+                is_saved = await db_helpers.upsert_imported_json_file(name_prefix, file, file_hash, async_db=db)
+                if is_saved is None:
+                    raise Exception("Couldn't save the imported JSON file's hash")
+            await db.commit()
+            new_items_count += len(new_items)
+        except Exception as e:
+            await db.rollback()
+            logger.error("Unknown error inserting JSON file's items", file=file, count=len(new_items), error=e)
 
+    logger.info("Seeded JSON files", name_prefix=name_prefix, new_items_count=new_items_count)
+    return new_items_count
@@ -0,0 +1,227 @@
+"""Seeding owners' OSS as an asyncio pipeline, with 3 stages connected by bounded queues:
+1 - fetch: gets owners' repos from their source, every source has its own workers, so it's limited by its own concurrency.
+2 - transform: filters the repos by the owner's actions, and converts them to OSS models.
+3 - write: upserts the OSS into the database in batches (see seeders/batch_writer), it's a single worker as it's the only one using the DB session.
+
+The queues are bounded, so if a later stage is slower the earlier ones wait for it (backpressure),
+instead of holding all owners' repos in memory.
+
+Every owner has a watermark - the latest push of its repos that we've seen - that's saved after all of its OSS are written,
+then the next runs only get the repos that changed after it (if Seeder.incremental is on).
+As the repos got by an incremental run are the changed ones, their OSS are always upserted with ON CONFLICT DO UPDATE,
+and watermarks are only saved when the existing OSS are updated, so changes skipped by DO NOTHING are never skipped for good.
+
+Every run is journaled: an owner is added to the run's journal with its watermark in the same transaction,
+so if the run stops before finishing (like a crash or a deploy), the next run resumes it and skips its done owners."""
+from typing import Any, Literal, TypedDict
+from datetime import datetime
+from types import ModuleType
+from collections.abc import Sequence
+from uuid import UUID
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+###
+from oss_archive.config import Seeder as seeder_config
+from oss_archive.utils.logger import logger
+from oss_archive.database.models import Owner as OwnerModel, OSS as OSSModel
+from oss_archive.database import helpers as db_helpers
+from oss_archive.seeders import helpers
+from oss_archive.seeders.batch_writer import OSSBatchWriter
+from oss_archive.seeders.progress import SeedProgress
+from oss_archive.seeders.sources import github as github_source, codeberg as codeberg_source
+
+# Every source module implements: get_repos_from_source(owner, since) & create_new_oss(owner, repo_dict),
+# and WATERMARK_FIELD: the repo's field that changes on every push
+SOURCES: dict[str, ModuleType] = {
+    "github": github_source,
+    "codeberg": codeberg_source,
+}
+
+
+def get_on_conflict() -> Literal["nothing", "update"]:
+    """Incremental runs only get the changed repos, so skipping the existing OSS (DO NOTHING) would drop their changes."""
+    if seeder_config.get("incremental"):
+        return "update"
+    return seeder_config.get("on_conflict")
+
+
+class FetchedReposType(TypedDict):
+    owner: OwnerModel
+    repos: list[dict[str, Any]]
+    watermark: datetime | None
+
+class TransformedReposType(TypedDict):
+    owner: OwnerModel
+    oss_list: list[OSSModel]
+    watermark: datetime | None
+
+
+async def seed_owners_oss(owners: Sequence[OwnerModel], db: AsyncSession, progress: SeedProgress | None = None) -> int | None:
+    """Run the pipeline for the owners, and return the count of the new OSS, or None if the run couldn't be started.
+    Pass a progress to follow the run's counters while it's running."""
+    if progress is None:
+        progress = SeedProgress()
+    progress.owners_total = len(owners)
+
+    run = await db_helpers.get_or_start_seed_run(async_db=db)
+    if run is None:
+        return None
+    # Plain values, as the stages' rollbacks (a batch or the journal couldn't be written) expire the session's objects,
+    # then reading their fields would lazy load them, which AsyncSession can't do outside of an await.
+    run_id = run.id
+    for instance in [run, *owners]:
+        if instance in db:
+            db.expunge(instance) # detached objects keep their loaded fields, and aren't expired by rollbacks
+    done_owners = await db_helpers.get_seed_run_done_owners(run_id, async_db=db)
+    if done_owners is None:
+        return None
+    if len(done_owners) > 0:
+        logger.info("Resuming seed run", run_id=run_id, started_at=run.started_at, done_owners_count=len(done_owners))
+        owners = [owner for owner in owners if owner.username not in done_owners]
+        progress.owners_done = progress.owners_total - len(owners)
+
+    queue_size = seeder_config.get("queue_size")
+    fetched_queue: asyncio.Queue[FetchedReposType | None] = asyncio.Queue(maxsize=queue_size)
+    write_queue: asyncio.Queue[TransformedReposType | None] = asyncio.Queue(maxsize=queue_size)
+
+    watermarks: dict[str, datetime | None] = {}
+    if seeder_config.get("incremental"):
+        saved_watermarks = await db_helpers.get_seed_watermarks(async_db=db)
+        if saved_watermarks is None:
+            logger.error("Couldn't get seed watermarks, so all owners' repos are fetched")
+        else:
+            watermarks = {owner_username: watermark.last_pushed_at for owner_username, watermark in saved_watermarks.items()}
+
+    owners_queues: dict[str, asyncio.Queue[OwnerModel]] = {}
+    for owner in owners:
+        if SOURCES.get(owner.source) is None:
+            logger.error("Unkown OSS source", owner=owner.username, source=owner.source)
+            progress.errors += 1
+            continue
+        if owners_queues.get(owner.source) is None:
+            owners_queues[owner.source] = asyncio.Queue()
+        owners_queues[owner.source].put_nowait(owner)
+
+    fetchers = [
+        asyncio.create_task(__fetch_stage(source, owners_queue, fetched_queue, watermarks, progress))
+        for source, owners_queue in owners_queues.items()
+        for _ in range(seeder_config.get("sources_concurrency").get(source, 1))
+    ]
+    transformers = [asyncio.create_task(__transform_stage(fetched_queue, write_queue)) for _ in range(seeder_config.get("transform_workers"))]
+    writer = asyncio.create_task(__write_stage(write_queue, run_id, db, progress))
+
+    try:
+        # Every stage is closed after the one before it finishes, by sending a None to each of its workers.
+        _ = await asyncio.gather(*fetchers)
+        for _ in transformers:
+            await fetched_queue.put(None)
+        _ = await asyncio.gather(*transformers)
+        await write_queue.put(None)
+        new_oss_count = await writer
+    except BaseException:
+        # If a stage raised (or the run is cancelled), the other stages would wait on their queues forever.
+        tasks = [*fetchers, *transformers, writer]
+        for task in tasks:
+            _ = task.cancel()
+        _ = await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    # Owners that failed aren't retried by resuming, as the next run goes through all owners again.
+    _ = await db_helpers.finish_seed_run(run_id, async_db=db)
+    progress.finish()
+    logger.info("Seeded all owners' OSS", run_id=run_id, owners_count=len(owners), new_oss_count=new_oss_count, **progress.to_dict())
+    return new_oss_count
+
+
+async def __fetch_stage(source: str, owners_queue: asyncio.Queue[OwnerModel], fetched_queue: asyncio.Queue[FetchedReposType | None], watermarks: dict[str, datetime | None], progress: SeedProgress):
+    source_module = SOURCES[source]
+    while not owners_queue.empty():
+        owner = owners_queue.get_nowait()
+        since = watermarks.get(owner.username)
+        try:
+            repos: list[dict[str, Any]] | None = await source_module.get_repos_from_source(owner, since=since)
+        except Exception as e:
+            logger.error("Unknown error getting owner's repos from source", owner=owner.username, source=source, error=e)
+            progress.errors += 1
+            continue
+        if repos is None:
+            progress.errors += 1
+            continue
+        progress.repos_fetched += len(repos)
+
+        logger.info("Got owners' repos", owner=owner.username, count=len(repos), since=since)
+        watermark = helpers.get_repos_watermark(repos, source_module.WATERMARK_FIELD, since)
+        await fetched_queue.put(FetchedReposType(owner=owner, repos=repos, watermark=watermark))
+
+
+async def __transform_stage(fetched_queue: asyncio.Queue[FetchedReposType | None], write_queue: asyncio.Queue[TransformedReposType | None]):
+    while True:
+        fetched = await fetched_queue.get()
+        if fetched is None:
+            return
+
+        owner = fetched["owner"]
+        source_module = SOURCES[owner.source]
+        oss_list: list[OSSModel] = []
+        for repo in fetched["repos"]:
+            should_apply_on = helpers.should_apply_action_on_oss(owner, repo.get("name"))
+            if not should_apply_on:
+                continue
+
+            new_oss: OSSModel | None = source_module.create_new_oss(owner, repo)
+            if new_oss is None:
+                continue
+            oss_list.append(new_oss)
+
+        await write_queue.put(TransformedReposType(owner=owner, oss_list=oss_list, watermark=fetched["watermark"]))
+
+
+async def __write_stage(write_queue: asyncio.Queue[TransformedReposType | None], run_id: UUID, db: AsyncSession, progress: SeedProgress) -> int:
+    on_conflict = get_on_conflict()
+    writer = OSSBatchWriter(db, batch_size=seeder_config.get("batch_size"), on_conflict=on_conflict)
+    pending_watermarks: dict[str, datetime | None] = {} # owners' watermarks waiting for their OSS to be written
+    while True:
+        transformed = await write_queue.get()
+        if transformed is None:
+            _ = await writer.flush()
+            await __mark_owners_done(run_id, writer.pop_done_owners(), pending_watermarks, db, progress)
+            __update_write_progress(writer, progress)
+            if writer.failed_count > 0:
+                logger.error("Some OSS couldn't be written", failed_count=writer.failed_count)
+            return len(writer.new_fullnames)
+
+        owner_username = transformed["owner"].username
+        pending_watermarks[owner_username] = transformed["watermark"]
+        await writer.add(owner_username, transformed["oss_list"])
+        logger.info("Queued owner's OSS for writing", owner=owner_username, count=len(transformed["oss_list"]))
+        await __mark_owners_done(run_id, writer.pop_done_owners(), pending_watermarks, db, progress)
+        __update_write_progress(writer, progress)
+
+
+def __update_write_progress(writer: OSSBatchWriter, progress: SeedProgress):
+    progress.oss_failed = writer.failed_count
+    progress.oss_written = writer.written_count
+    progress.oss_inserted = len(writer.new_fullnames)
+
+
+async def __mark_owners_done(run_id: UUID, done_owners: list[str], pending_watermarks: dict[str, datetime | None], db: AsyncSession, progress: SeedProgress):
+    """Save the owners' watermarks (only if the existing OSS are updated) and add them to the run's journal, in a single transaction."""
+    if len(done_owners) == 0:
+        return
+    watermarks = {owner_username: pending_watermarks.pop(owner_username, None) for owner_username in done_owners}
+    try:
+        # Under DO NOTHING the changes of the existing OSS aren't written, so their watermarks aren't advanced past them.
+        if get_on_conflict() == "update":
+            is_saved = await db_helpers.upsert_seed_watermarks(watermarks, async_db=db)
+            if is_saved is None:
+                raise Exception("Couldn't upsert the seed watermarks")
+        is_journaled = await db_helpers.add_seed_journal_entries(run_id, done_owners, async_db=db)
+        if is_journaled is None:
+            raise Exception("Couldn't add the seed journal entries")
+        await db.commit()
+        progress.owners_done += len(done_owners)
+    except Exception as e:
+        await db.rollback()
+        progress.errors += 1
+        # The owners' repos are fetched again from the old watermark next time, and written again without duplicates.
+        logger.error("Unknown Error when marking owners as done", owners=done_owners, error=e)
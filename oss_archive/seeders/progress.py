@@ -0,0 +1,53 @@
+"""Live counters of a seeding run, updated by the pipeline's stages while it runs, and read by the seed jobs API."""
+from typing import TypedDict
+import time
+
+
+class SeedProgressType(TypedDict):
+    owners_total: int
+    owners_done: int
+    repos_fetched: int
+    oss_written: int # OSS upserted, new or already existing
+    oss_inserted: int # new OSS only
+    oss_failed: int # OSS in batches that couldn't be written
+    errors: int # owners that couldn't be fetched, or couldn't be marked as done
+    elapsed_seconds: float
+    repos_per_second: float
+    oss_per_second: float
+
+
+class SeedProgress():
+    """All stages run on the same event loop, so the counters are updated without locks."""
+    def __init__(self):
+        self.owners_total: int = 0
+        self.owners_done: int = 0
+        self.repos_fetched: int = 0
+        self.oss_written: int = 0
+        self.oss_inserted: int = 0
+        self.oss_failed: int = 0
+        self.errors: int = 0
+        self.__started_at: float = time.monotonic()
+        self.__finished_at: float | None = None
+
+    def finish(self):
+        if self.__finished_at is None:
+            self.__finished_at = time.monotonic()
+
+    def get_elapsed_seconds(self) -> float:
+        end = self.__finished_at if self.__finished_at is not None else time.monotonic()
+        return end - self.__started_at
+
+    def to_dict(self) -> SeedProgressType:
+        elapsed = self.get_elapsed_seconds()
+        return SeedProgressType(
+            owners_total=self.owners_total,
+            owners_done=self.owners_done,
+            repos_fetched=self.repos_fetched,
+            oss_written=self.oss_written,
+            oss_inserted=self.oss_inserted,
+            oss_failed=self.oss_failed,
+            errors=self.errors,
+            elapsed_seconds=round(elapsed, 3),
+            repos_per_second=round(self.repos_fetched / elapsed, 3) if elapsed > 0 else 0.0,
+            oss_per_second=round(self.oss_written / elapsed, 3) if elapsed > 0 else 0.0,
+        )
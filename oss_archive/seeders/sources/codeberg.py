@@ -1,11 +1,8 @@
 from typing import Any
-from sqlalchemy.orm import Session
-# from sqlalchemy import select, delete, update
-# from sqlalchemy import exc 
-from psycopg import errors
+from datetime import datetime
 ###
 from oss_archive.utils.logger import logger
-from oss_archive.utils import httpx
+from oss_archive.utils import retry, pagination, httpx
 from oss_archive.utils.formatter import format_oss_fullname
 from oss_archive.database.models import Owner as OwnerModel, OSS as OSSModel
 from oss_archive.schemas import general as general_schemas
@@ -13,69 +10,14 @@ from oss_archive.seeders import helpers
 
 API_BASE_URL = "https://codeberg.org/api/v1"
 DEFAULT_PRIORITY = 7
+PAGE_LIMIT = 50 # max page size that Forgejo's API allows by default
+WATERMARK_FIELD = "updated_at" # repo's field used as the owner's seed watermark, Forgejo updates it on every push
 
-async def seed_owner_oss(owner: OwnerModel, db: Session):
-    repos_arr = await get_repos_from_source(owner)
-    if repos_arr is None:
-        return None
-
-    logger.info("Got owners' repos", count=len(repos_arr))
-    new_oss: list[OSSModel] = []
-    for repo in repos_arr:
-        should_apply_on = helpers.should_apply_action_on_oss(owner, repo.get("name"))
-        if not should_apply_on:
-            continue
-
-        seeded_oss = await seed_oss(owner, repo, db)
-        if seeded_oss is None:
-            continue
-    
-        logger.info(f"Seeded OSS: {seeded_oss.fullname}")
-
-        new_oss.append(seeded_oss)
-
-    logger.info("Seeded all OSS", count=len(new_oss))
-
-    return new_oss
-
-async def seed_oss(owner: OwnerModel, repo_dict: dict[str, Any], db: Session):
-    try:
-        repo_name = repo_dict.get("name")
-        if repo_name is None:
-            return None
-        oss_fullname = format_oss_fullname(owner.username, repo_name)
-
-        oss_does_exists = await helpers.does_oss_exists(oss_fullname, db)
-        if oss_does_exists:
-            return None
-
-        new_oss = create_new_oss(owner, repo_dict)
-        if new_oss is None:
-            return None
-        
-        db.add(new_oss)
-        db.commit()
-
-        db.refresh(new_oss)
-        
-        return new_oss
-    except errors.UniqueViolation as e:
-        db.rollback()
-        logger.error("Error Inserting OSS for Unique key Violation OSS from Owner's repo", owner=owner, error=e)
-        return None
-    except errors.CheckViolation as e:
-        db.rollback()
-        logger.error("Error Inserting OSS for check Violation OSS from Owner's repo", owner=owner, error=e)
-        return None
-    except Exception as e:
-        db.rollback()
-        logger.error("Unknown Error when Inserting OSS from Owner's repom", owner=owner, error=e)
-        return None
-
-async def get_repos_from_source(owner: OwnerModel):
+async def get_repos_from_source(owner: OwnerModel, since: datetime | None = None):
+    """Get owner's repos, or only the ones updated after {since} (the owner's watermark) if it's passed."""
     match owner.type:
         case general_schemas.OwnerTypeEnum.Organization:
-            res = await httpx.async_get(base_url=f"{API_BASE_URL}", endpoint=f"/orgs/{owner.username}/repos")
+            endpoint = f"/orgs/{owner.username}/repos"
         case general_schemas.OwnerTypeEnum.Individual:
             logger.error("Can't get Individual data without authentication token")
             return None
@@ -83,11 +25,47 @@ async def get_repos_from_source(owner: OwnerModel):
         #     logger.error(f"Uknown OwnerType: {meta_item.type}")
         #     return None
 
-    if res is None or res.status_code != 200:
-        logger.info("Couldn't get repos from source", res=res)
+    if since is not None:
+        return await __get_repos_updated_since(owner, since)
+
+    # Get all pages, as orgs can have more repos than a single page can hold.
+    pages = await pagination.async_get_all_pages_by_total_count(
+        base_url=API_BASE_URL,
+        endpoint=endpoint,
+        limit=PAGE_LIMIT,
+        use_cache=True,
+        retry_policy=retry.SEEDING_RETRY_POLICY
+        )
+    if pages is None:
+        logger.info("Couldn't get repos from source", owner=owner.username)
+        return None
+
+    res_arr: list[dict[str, Any]] = [repo for page in pages for repo in page]
+    return res_arr
+
+async def __get_repos_updated_since(owner: OwnerModel, since: datetime):
+    """Forgejo's org repos listing can't be sorted, so we use repos search by the org's id sorted by the last update,
+    and stop at the first page that has a repo that wasn't updated since the watermark."""
+    org_res = await httpx.async_get(base_url=API_BASE_URL, endpoint=f"/orgs/{owner.username}", use_cache=True, retry_policy=retry.SEEDING_RETRY_POLICY)
+    if org_res is None or org_res.status_code != 200:
+        logger.info("Couldn't get owner's id from source", owner=owner.username, res=org_res)
+        return None
+    owner_id = org_res.json().get("id")
+
+    pages = await pagination.async_get_pages_till(
+        base_url=API_BASE_URL,
+        endpoint=f"/repos/search?uid={owner_id}&exclusive=true&sort=updated&order=desc",
+        page_query=lambda page: f"limit={PAGE_LIMIT}&page={page}",
+        is_last_page=lambda page: len(page) < PAGE_LIMIT or not all(helpers.is_repo_changed_since(repo, WATERMARK_FIELD, since) for repo in page),
+        items_key="data",
+        use_cache=True,
+        retry_policy=retry.SEEDING_RETRY_POLICY
+        )
+    if pages is None:
+        logger.info("Couldn't get updated repos from source", owner=owner.username, since=since)
         return None
 
-    res_arr: list[dict[str, Any]] = res.json()
+    res_arr: list[dict[str, Any]] = [repo for page in pages for repo in page if helpers.is_repo_changed_since(repo, WATERMARK_FIELD, since)]
     return res_arr
 
 
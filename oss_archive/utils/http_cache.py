@@ -0,0 +1,157 @@
+"""A disk-backed cache for conditional HTTP requests (ETag / Last-Modified).
+
+We store the validators and the body of every cacheable GET response by its URL, send them back
+as If-None-Match / If-Modified-Since on the next request, and replay the cached body if the upstream answered with 304 Not Modified.
+On github 304s don't count against the rate-limit, so unchanged listings are nearly free."""
+from typing import TypedDict
+import hashlib
+import json
+import os
+import threading
+from httpx import Headers, Response
+###
+from oss_archive.utils.logger import logger
+
+# Headers that describe how the body was transferred, they don't apply to the decoded body we store.
+_TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+class CacheEntryType(TypedDict):
+    url: str
+    etag: str | None
+    last_modified: str | None
+    headers: list[tuple[str, str]]
+
+
+class HTTPCache():
+    """Every entry is saved as 2 files in the cache's directory: {key}.json for its metadata and {key}.body for its body,
+    the key is a hash of the URL and the Authorization header, so different tokens don't share entries.
+
+    The cache is bounded by max_size (in bytes), when it's exceeded the least recently used entries are evicted.
+    It's used from threads too (async requests use it in asyncio.to_thread), so writes & evictions are done under a lock."""
+    def __init__(self, path: str, max_size: int):
+        self.path: str = path
+        self.max_size: int = max_size
+        self.__size: int | None = None # lazily calculated on the first write
+        self.__lock: threading.Lock = threading.Lock()
+
+    def __get_key(self, url: str, headers: Headers) -> str:
+        authorization = headers.get("Authorization") or ""
+        return hashlib.sha256(f"{url}\n{authorization}".encode()).hexdigest()
+
+    def __get_paths(self, key: str) -> tuple[str, str]:
+        return os.path.join(self.path, f"{key}.json"), os.path.join(self.path, f"{key}.body")
+
+    def __read_entry(self, key: str) -> CacheEntryType | None:
+        meta_path, _ = self.__get_paths(key)
+        try:
+            with open(meta_path, "r") as file:
+                entry: CacheEntryType = json.load(file)
+                return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Couldn't read HTTP cache entry", key=key, error=e)
+            return None
+
+    def conditional_headers(self, url: str, headers: Headers) -> Headers:
+        """Add the validators of the cached entry - if it exists - to a copy of the request's headers."""
+        entry = self.__read_entry(self.__get_key(url, headers))
+        conditional_headers = Headers(headers)
+        if entry is None:
+            return conditional_headers
+
+        if entry.get("etag") is not None:
+            conditional_headers["If-None-Match"] = entry["etag"] # pyright:ignore[reportArgumentType]
+        if entry.get("last_modified") is not None:
+            conditional_headers["If-Modified-Since"] = entry["last_modified"] # pyright:ignore[reportArgumentType]
+
+        return conditional_headers
+
+    def store(self, url: str, headers: Headers, response: Response):
+        """Save a successful response if it has validators, otherwise there's no way to revalidate it."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or (etag is None and last_modified is None):
+            return
+
+        key = self.__get_key(url, headers)
+        meta_path, body_path = self.__get_paths(key)
+        entry = CacheEntryType(
+            url=url,
+            etag=etag,
+            last_modified=last_modified,
+            headers=[(name, value) for name, value in response.headers.multi_items() if name.lower() not in _TRANSFER_HEADERS],
+        )
+        try:
+            with self.__lock:
+                os.makedirs(self.path, exist_ok=True)
+                size = self.__get_size() - self.__get_entry_size(key)
+                # Write to temporary files then rename them, so a crash never leaves a half-written entry.
+                with open(body_path + ".tmp", "wb") as file:
+                    _ = file.write(response.content)
+                with open(meta_path + ".tmp", "w") as file:
+                    json.dump(entry, file)
+                os.replace(body_path + ".tmp", body_path)
+                os.replace(meta_path + ".tmp", meta_path)
+
+                self.__size = size + self.__get_entry_size(key)
+                if self.__size > self.max_size:
+                    self.__evict()
+        except Exception as e:
+            logger.error("Couldn't write HTTP cache entry", url=url, error=e)
+
+    def replay(self, url: str, headers: Headers, response: Response) -> Response | None:
+        """Build a 200 response from the cached entry for a 304 response,
+        the 304's headers override the cached ones - like the rate-limit headers - as they're fresher."""
+        key = self.__get_key(url, headers)
+        entry = self.__read_entry(key)
+        if entry is None:
+            return None
+
+        _, body_path = self.__get_paths(key)
+        try:
+            with open(body_path, "rb") as file:
+                body = file.read()
+            os.utime(body_path) # mark it as recently used, for eviction
+        except Exception as e:
+            logger.error("Couldn't read HTTP cache entry's body", url=url, error=e)
+            return None
+
+        replayed_headers = Headers(entry.get("headers"))
+        for name, value in response.headers.items():
+            if name.lower() not in _TRANSFER_HEADERS:
+                replayed_headers[name] = value
+
+        return Response(status_code=200, headers=replayed_headers, content=body, request=response.request)
+
+    def __get_entry_size(self, key: str) -> int:
+        size = 0
+        for path in self.__get_paths(key):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def __get_size(self) -> int:
+        if self.__size is None:
+            self.__size = sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+        return self.__size
+
+    def __evict(self):
+        """Remove the least recently used entries until the cache is under 90% of its max size."""
+        bodies = [entry for entry in os.scandir(self.path) if entry.name.endswith(".body")]
+        bodies.sort(key=lambda entry: entry.stat().st_mtime)
+
+        size = self.__get_size()
+        for body in bodies:
+            if size <= self.max_size * 0.9:
+                break
+            key = body.name.removesuffix(".body")
+            entry_size = self.__get_entry_size(key)
+            for path in self.__get_paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            size -= entry_size
+
+        self.__size = size
+        logger.info("Evicted HTTP cache entries", size=size, max_size=self.max_size)
@@ -1,21 +1,157 @@
 """httpx config module to standardize our requests, adding retries, error handling and other features."""
 from typing import TypedDict, Any
 from datetime import timedelta
-from httpx import URL, Client, Cookies, Headers, Response, QueryParams, AsyncClient, Timeout
+import asyncio
+import time
+from importlib.util import find_spec
+from httpx import URL, Client, Cookies, Headers, Response, QueryParams, AsyncClient, Timeout, Limits
 from httpx import AsyncHTTPTransport, HTTPTransport
-from httpx import RequestError, NetworkError, HTTPStatusError, ConnectError, ReadError
+from httpx import RequestError, NetworkError, HTTPStatusError, ConnectError, ReadError, TransportError
 ###
+from oss_archive.config import HTTPX as httpx_config, HTTPCache as http_cache_config, RateLimit as rate_limit_config
 from oss_archive.utils.logger import logger
+from oss_archive.utils.http_cache import HTTPCache
+from oss_archive.utils.rate_limiter import RateLimiter
+from oss_archive.utils.retry import RetryPolicyType, DEFAULT_RETRY_POLICY, NON_IDEMPOTENT_RETRY_POLICY, get_retry_delay
 
 
-# Note about retries: We can use tenacity(https://tenacity.readthedocs.io/en/latest/) to configure more complex logic
-SYNC_TRANSPORT = HTTPTransport(retries=3)
-ASYNC_TRANSPORT = AsyncHTTPTransport(retries=3)
-
+# Note about retries: the transport's retries only cover connection errors,
+# while retrying on responses (429, 502...etc) and other errors is done using a retry policy from utils/retry, that's chosen per call site.
 DEFAULT_TIMEOUT = Timeout(5.0, connect=5.0)
 
 DEFAULT_HEADERS = Headers(headers={"Content-Type": "application/json"})
 
+DEFAULT_LIMITS = Limits(
+    max_connections=httpx_config.get("max_connections"),
+    max_keepalive_connections=httpx_config.get("max_keepalive_connections"),
+    keepalive_expiry=httpx_config.get("keepalive_expiry"),
+)
+
+# Used by GET requests with use_cache=True, to make conditional requests and replay the cached body on 304 Not Modified.
+http_cache = HTTPCache(path=http_cache_config.get("path"), max_size=http_cache_config.get("max_size"))
+
+# Pooled clients, one for every upstream host (and transport retries), so requests to the same host reuse
+# its open connections instead of paying a new TCP+TLS handshake every time.
+# They're opened in the app's lifespan with open_clients() and closed with close_clients(),
+# and any host that wasn't opened before gets its client lazily on its first request.
+__async_clients: dict[tuple[str, int], AsyncClient] = {}
+__sync_clients: dict[tuple[str, int], Client] = {}
+
+# A rate limiter for every upstream host, paces async requests using the rate-limit headers the host reports.
+__rate_limiters: dict[str, RateLimiter] = {}
+
+
+def __get_origin(base_url: str) -> str:
+    """Get the scheme and host of the url, like: https://api.github.com"""
+    url = URL(base_url)
+    return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+def __use_http2() -> bool:
+    if not httpx_config.get("http2"):
+        return False
+    if find_spec("h2") is None:
+        logger.warning("HTTP/2 is enabled, but 'h2' package isn't installed (pip install .[http2]), so HTTP/1.1 is used instead")
+        return False
+    return True
+
+def get_async_client(base_url: str, retries: int = 3) -> AsyncClient:
+    """Get the pooled async client of the base url's host, and create it if it doesn't exist."""
+    key = (__get_origin(base_url), retries)
+    client = __async_clients.get(key)
+    if client is None or client.is_closed:
+        transport = AsyncHTTPTransport(retries=retries, limits=DEFAULT_LIMITS, http2=__use_http2())
+        client = AsyncClient(transport=transport, timeout=DEFAULT_TIMEOUT)
+        __async_clients[key] = client
+
+    return client
+
+def get_sync_client(base_url: str, retries: int = 3) -> Client:
+    """Get the pooled sync client of the base url's host, and create it if it doesn't exist."""
+    key = (__get_origin(base_url), retries)
+    client = __sync_clients.get(key)
+    if client is None or client.is_closed:
+        transport = HTTPTransport(retries=retries, limits=DEFAULT_LIMITS, http2=__use_http2())
+        client = Client(transport=transport, timeout=DEFAULT_TIMEOUT)
+        __sync_clients[key] = client
+
+    return client
+
+def get_rate_limiter(base_url: str) -> RateLimiter:
+    """Get the rate limiter of the base url's host, and create it if it doesn't exist."""
+    origin = __get_origin(base_url)
+    rate_limiter = __rate_limiters.get(origin)
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(host=origin, capacity=rate_limit_config.get("burst"), safety_margin=rate_limit_config.get("safety_margin"))
+        __rate_limiters[origin] = rate_limiter
+
+    return rate_limiter
+
+async def __async_send(client: AsyncClient, base_url: str, method: str, url: str, headers: Headers, timeout: Timeout, retry_policy: RetryPolicyType, body: Any = None) -> Response:
+    """Make the request after waiting for the host's rate limiter, then update it from the response's headers,
+    and retry it following the retry policy."""
+    rate_limiter = get_rate_limiter(base_url)
+    host = __get_origin(base_url)
+    started_at = time.monotonic()
+    attempt = 0
+    while True:
+        await rate_limiter.acquire()
+        try:
+            response = await client.request(method=method, url=url, headers=headers, json=body, timeout=timeout)
+        except TransportError as e:
+            delay = get_retry_delay(host, retry_policy, attempt, started_at, error=e)
+            if delay is None:
+                raise
+        else:
+            rate_limiter.update(response.headers)
+            delay = get_retry_delay(host, retry_policy, attempt, started_at, response=response)
+            if delay is None:
+                return response
+
+        await asyncio.sleep(delay)
+        attempt += 1
+
+def __sync_send(client: Client, base_url: str, method: str, url: str, headers: Headers, timeout: Timeout, retry_policy: RetryPolicyType, body: Any = None) -> Response:
+    """Make the request and retry it following the retry policy."""
+    host = __get_origin(base_url)
+    started_at = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            response = client.request(method=method, url=url, headers=headers, json=body, timeout=timeout)
+        except TransportError as e:
+            delay = get_retry_delay(host, retry_policy, attempt, started_at, error=e)
+            if delay is None:
+                raise
+        else:
+            delay = get_retry_delay(host, retry_policy, attempt, started_at, response=response)
+            if delay is None:
+                return response
+
+        time.sleep(delay)
+        attempt += 1
+
+def open_clients(base_urls: list[str]):
+    """Create the pooled clients for the upstream hosts we know about, used in the app's lifespan."""
+    for base_url in base_urls:
+        if base_url == "":
+            continue
+        _ = get_async_client(base_url)
+        _ = get_sync_client(base_url)
+
+    return
+
+async def close_clients():
+    """Close all pooled clients and their connections, used in the app's lifespan."""
+    for client in __async_clients.values():
+        await client.aclose()
+    for client in __sync_clients.values():
+        client.close()
+
+    __async_clients.clear()
+    __sync_clients.clear()
+
+    return
+
 
 class ResponseMetadata(TypedDict):
     url: URL
@@ -31,19 +167,40 @@ def get_response_metadata(res: Response) -> ResponseMetadata:
 
     return ResponseMetadata(url=url, headers=headers, cookies=cookies, time_elapsed=time_elapsed)
 
-def get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+def __get_cached_response(url: str, headers: Headers, response: Response) -> Response | None:
+    """Replay the cached body if the response is 304 Not Modified, or cache it if it's a new one.
+    Returns None if the cached entry is missing for a 304 response, so the request should be made again without validators."""
+    if response.status_code == 304:
+        return http_cache.replay(url, headers, response)
+
+    http_cache.store(url, headers, response)
+    return response
+
+def get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, use_cache: bool = False, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make a sync GET request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
+    If use_cache is True, it makes a conditional request using the cached ETag/Last-Modified,
+    and replays the cached body when the source answers with 304 Not Modified.
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        with Client(transport=HTTPTransport(retries=retries), timeout=timeout) as client:
-            response = client.get(
-                url=base_url + endpoint,
-                headers=headers,
-            )
+        url = base_url + endpoint
+        client = get_sync_client(base_url, retries)
+        response = __sync_send(
+            client, base_url, "GET",
+            url=url,
+            headers=http_cache.conditional_headers(url, headers) if use_cache else headers,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        if use_cache:
+            cached_response = __get_cached_response(url, headers, response)
+            if cached_response is None:
+                cached_response = __sync_send(client, base_url, "GET", url=url, headers=headers, timeout=timeout, retry_policy=retry_policy)
+            response = cached_response
 
-            return response
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -53,18 +210,32 @@ def get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, header
         logger.error("Error while making a request", error=e)
         return None
 
-async def async_get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+async def async_get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, use_cache: bool = False, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make an async GET request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
+    If use_cache is True, it makes a conditional request using the cached ETag/Last-Modified,
+    and replays the cached body when the source answers with 304 Not Modified.
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        async with AsyncClient(transport=AsyncHTTPTransport(retries=retries), timeout=timeout) as client:
-            response = await client.get(
-                url=base_url + endpoint,
-                headers=headers,
-            )
-            return response
+        url = base_url + endpoint
+        client = get_async_client(base_url, retries)
+        # The cache's files are read & written in a thread, so they don't block the event loop.
+        response = await __async_send(
+            client, base_url, "GET",
+            url=url,
+            headers=await asyncio.to_thread(http_cache.conditional_headers, url, headers) if use_cache else headers,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        if use_cache:
+            cached_response = await asyncio.to_thread(__get_cached_response, url, headers, response)
+            if cached_response is None:
+                cached_response = await __async_send(client, base_url, "GET", url=url, headers=headers, timeout=timeout, retry_policy=retry_policy)
+            response = cached_response
+
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -74,20 +245,22 @@ async def async_get(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIM
         logger.error("Error while making a request", error=e)
         return None
 
-def post(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+def post(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = NON_IDEMPOTENT_RETRY_POLICY)-> Response | None:
     """A helper function to make a sync POST request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        with Client(transport=HTTPTransport(retries=retries), timeout=timeout) as client:
-            response = client.post(
-                url=base_url + endpoint,
-                headers=headers,
-                json=body
-            )
-
-            return response
+        client = get_sync_client(base_url, retries)
+        response = __sync_send(
+            client, base_url, "POST",
+            url=base_url + endpoint,
+            headers=headers,
+            body=body,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -97,19 +270,22 @@ def post(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIM
         logger.error("Error while making a request", error=e)
         return None
 
-async def async_post(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+async def async_post(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = NON_IDEMPOTENT_RETRY_POLICY)-> Response | None:
     """A helper function to make an async POST request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        async with AsyncClient(transport=AsyncHTTPTransport(retries=retries), timeout=timeout) as client:
-            response = await client.post(
-                url=base_url + endpoint,
-                headers=headers,
-                json=body
-            )
-            return response
+        client = get_async_client(base_url, retries)
+        response = await __async_send(
+            client, base_url, "POST",
+            url=base_url + endpoint,
+            headers=headers,
+            body=body,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -119,20 +295,22 @@ async def async_post(base_url: str, endpoint: str, body: Any, timeout: Timeout =
         logger.error("Error while making a request", error=e)
         return None
 
-def put(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+def put(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make a sync PUT request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        with Client(transport=HTTPTransport(retries=retries), timeout=timeout) as client:
-            response = client.put(
-                url=base_url + endpoint,
-                headers=headers,
-                json=body
-            )
-
-            return response
+        client = get_sync_client(base_url, retries)
+        response = __sync_send(
+            client, base_url, "PUT",
+            url=base_url + endpoint,
+            headers=headers,
+            body=body,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -142,19 +320,22 @@ def put(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIME
         logger.error("Error while making a request", error=e)
         return None
 
-async def async_put(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+async def async_put(base_url: str, endpoint: str, body: Any, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make an async PUT request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        async with AsyncClient(transport=AsyncHTTPTransport(retries=retries), timeout=timeout) as client:
-            response = await client.put(
-                url=base_url + endpoint,
-                headers=headers,
-                json=body
-            )
-            return response
+        client = get_async_client(base_url, retries)
+        response = await __async_send(
+            client, base_url, "PUT",
+            url=base_url + endpoint,
+            headers=headers,
+            body=body,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -164,19 +345,21 @@ async def async_put(base_url: str, endpoint: str, body: Any, timeout: Timeout =
         logger.error("Error while making a request", error=e)
         return None
 
-def delete(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+def delete(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make a sync DELETE request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        with Client(transport=HTTPTransport(retries=retries), timeout=timeout) as client:
-            response = client.delete(
-                url=base_url + endpoint,
-                headers=headers,
-            )
-
-            return response
+        client = get_sync_client(base_url, retries)
+        response = __sync_send(
+            client, base_url, "DELETE",
+            url=base_url + endpoint,
+            headers=headers,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
@@ -186,18 +369,21 @@ def delete(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, hea
         logger.error("Error while making a request", error=e)
         return None
 
-async def async_delete(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3)-> Response | None:
+async def async_delete(base_url: str, endpoint: str, timeout: Timeout = DEFAULT_TIMEOUT, headers: Headers = DEFAULT_HEADERS, retries: int = 3, retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY)-> Response | None:
     """A helper function to make an async DELETE request using httpx,
     and adding the endpoint parameter to the base url.
-    
+
     example for endpoint paramater: /admin/orgs"""
     try:
-        async with AsyncClient(transport=AsyncHTTPTransport(retries=retries), timeout=timeout) as client:
-            response = await client.delete(
-                url=base_url + endpoint,
-                headers=headers,
-            )
-            return response
+        client = get_async_client(base_url, retries)
+        response = await __async_send(
+            client, base_url, "DELETE",
+            url=base_url + endpoint,
+            headers=headers,
+            timeout=timeout,
+            retry_policy=retry_policy,
+        )
+        return response
     except NetworkError as e:
         logger.error("network error while making the request", error=e)
         return None
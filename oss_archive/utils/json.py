@@ -1,16 +1,35 @@
 import json
 from pydantic import BaseModel, ValidationError, Field
-from typing import Annotated, TypedDict, Any
+from pydantic_core import from_json
+from typing import Annotated, TypedDict, Any, Literal
+from collections import deque
+from collections.abc import AsyncGenerator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import asyncio
+import hashlib
+import tempfile
 import os
 ###
-from oss_archive.config import JSON_FILES_PATH
+from oss_archive.config import JSON_FILES_PATH, JSON_PARSE_WORKERS, JSON_ARCHIVE_FORMAT, JSON_ARCHIVE_CHUNK_SIZE
 from oss_archive.utils.logger import logger
 from oss_archive.utils.formatter import format_file_name
 # from oss_archive.schemas.category import JSONSchema as CategoryJSONSchema
 # from oss_archive.schemas.owner import JSONSchema as OwnerJSONSchema
 # from oss_archive.schemas.oss import JSONSchema as OSSJSONSchema
 
+# zstd is optional, it's in python's standard library since 3.14, or it's from zstandard package.
+try:
+    from compression import zstd # pyright:ignore[reportMissingImports]
+except ImportError:
+    try:
+        import zstandard as zstd # pyright:ignore[reportMissingImports]
+    except ImportError:
+        zstd = None
+
 DEFAULT_MAX_LENGTH = 100 # used as a max_length for the list of blocks in blocks' JSON file.
+NDJSON_DEFAULT_MAX_LENGTH = 10_000 # ndjson.zst files are compressed, so they can hold more items, and we get fewer files.
+ZSTD_LEVEL = 10
 
 class JSONFile(
     BaseModel,
@@ -19,31 +38,112 @@ class JSONFile(
     file_number: Annotated[int, Field(default=1, ge=1)]
     items: Annotated[list[Any], Field(default=[], max_length=DEFAULT_MAX_LENGTH)]
 
+class NDJSONFileHeader(
+    BaseModel,
+    ):
+    """The first line of a ndjson.zst file, then every line after it is an item."""
+    priority: Annotated[int, Field(ge=1, le=10)]
+    file_number: Annotated[int, Field(default=1, ge=1)]
+
 
+JSONFileFormatType = Literal["json", "ndjson.zst"]
 
 class JSONFileConfigType(TypedDict):
     name_prefix: str
     json_dir: str
-    items_max_length: int
+    items_max_length: int # max items in a file, it can't be more than DEFAULT_MAX_LENGTH for json format
+    format: JSONFileFormatType
+    key_field: str # item's unique field, used for the manifest's key ranges
+
+__items_max_length = JSON_ARCHIVE_CHUNK_SIZE or (NDJSON_DEFAULT_MAX_LENGTH if JSON_ARCHIVE_FORMAT == "ndjson.zst" else DEFAULT_MAX_LENGTH)
+CategoriesJSONFileConfig = JSONFileConfigType(name_prefix="categories", json_dir=f"{JSON_FILES_PATH}categories/", items_max_length=__items_max_length, format=JSON_ARCHIVE_FORMAT, key_field="key")
+OwnersJSONFileConfig = JSONFileConfigType(name_prefix="owners", json_dir=f"{JSON_FILES_PATH}owners/", items_max_length=__items_max_length, format=JSON_ARCHIVE_FORMAT, key_field="username")
+OSSJSONFileConfig = JSONFileConfigType(name_prefix="oss", json_dir=f"{JSON_FILES_PATH}oss/", items_max_length=__items_max_length, format=JSON_ARCHIVE_FORMAT, key_field="fullname")
+
+MANIFEST_FILE_NAME = "manifest.json" # in every json_dir, listing its files
+
+class ManifestFile(
+    BaseModel,
+    ):
+    file_name: Annotated[str, Field()]
+    hash: Annotated[str, Field(description="sha256 hex digest of the file's content")]
+    items_count: Annotated[int, Field(ge=0)]
+    priority: Annotated[int, Field(ge=1, le=10)]
+    first_key: Annotated[str | None, Field(default=None)]
+    last_key: Annotated[str | None, Field(default=None)]
+
+class Manifest(
+    BaseModel,
+    ):
+    name_prefix: Annotated[str, Field()]
+    format: Annotated[JSONFileFormatType, Field()]
+    items_count: Annotated[int, Field(ge=0)]
+    files: Annotated[list[ManifestFile], Field(default=[])]
 
-CategoriesJSONFileConfig = JSONFileConfigType(name_prefix="categories", json_dir=f"{JSON_FILES_PATH}categories/", items_max_length=DEFAULT_MAX_LENGTH)
-OwnersJSONFileConfig = JSONFileConfigType(name_prefix="owners", json_dir=f"{JSON_FILES_PATH}owners/", items_max_length=DEFAULT_MAX_LENGTH)
-OSSJSONFileConfig = JSONFileConfigType(name_prefix="oss", json_dir=f"{JSON_FILES_PATH}oss/", items_max_length=DEFAULT_MAX_LENGTH)
+def get_file_extension(config: JSONFileConfigType) -> str:
+    return ".ndjson.zst" if config.get("format") == "ndjson.zst" else ".json"
+
+def get_file_format(file_name: str) -> JSONFileFormatType:
+    """Get the file's format by its extension, so an archive is read whatever format it was written with,
+    even if it's not the config's format (JSON_ARCHIVE_FORMAT) anymore."""
+    return "ndjson.zst" if file_name.endswith(".ndjson.zst") else "json"
 
 def get_json_files(json_config_file: JSONFileConfigType) -> list[str]:
-    files = [file for file in os.listdir(json_config_file.get("json_dir")) if file.endswith('.json')]
+    """Get the json_dir's files of both formats."""
+    files = [file for file in os.listdir(json_config_file.get("json_dir")) if file.endswith((".json", ".ndjson.zst")) and file != MANIFEST_FILE_NAME]
     return files
 
+def get_manifest(config: JSONFileConfigType) -> Manifest | None:
+    """Get the json_dir's manifest, or None if it doesn't exist or isn't valid."""
+    try:
+        with open(config.get("json_dir") + MANIFEST_FILE_NAME, "rb") as file:
+            return Manifest.model_validate_json(file.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error("Couldn't read manifest", name_prefix=config.get("name_prefix"), error=e)
+        return None
+
+def __zstd_compress(data: bytes) -> bytes:
+    if zstd is None:
+        raise RuntimeError("zstd isn't available, use python 3.14+ or install the zstd extra: pip install .[zstd]")
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zstd.compress(data, level=ZSTD_LEVEL)
+
+def __zstd_decompress(data: bytes) -> bytes:
+    if zstd is None:
+        raise RuntimeError("zstd isn't available, use python 3.14+ or install the zstd extra: pip install .[zstd]")
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdDecompressor().decompressobj().decompress(data)
+    return zstd.decompress(data)
+
+def encode_json_file(config: JSONFileConfigType, json_file: JSONFile) -> bytes:
+    """Get the file's content in the config's format."""
+    if config.get("format") == "ndjson.zst":
+        header = NDJSONFileHeader(priority=json_file.priority, file_number=json_file.file_number)
+        lines = [header.model_dump_json(), *[json.dumps(item) for item in json_file.model_dump(mode='json').get("items", [])]]
+        return __zstd_compress("\n".join(lines).encode())
+
+    return json.dumps(json_file.model_dump(mode='json')).encode()
+
+def decode_json_file(file_format: JSONFileFormatType, content: bytes) -> JSONFile:
+    """Parse the file's content in its format (see get_file_format), it raises ValidationError if it's not valid."""
+    if file_format == "ndjson.zst":
+        lines = __zstd_decompress(content).splitlines()
+        header = NDJSONFileHeader.model_validate_json(lines[0] if len(lines) > 0 else b"")
+        # model_construct, as a ndjson.zst file can have more than DEFAULT_MAX_LENGTH items.
+        return JSONFile.model_construct(priority=header.priority, file_number=header.file_number, items=[from_json(line) for line in lines[1:] if line.strip()])
+
+    # Parsing & validating the raw bytes at once by pydantic-core, without building python's dicts first.
+    return JSONFile.model_validate_json(content)
+
 def get_json_file_data(json_config_file: JSONFileConfigType, file_name: str):
     try:
-        with open(json_config_file.get("json_dir")+file_name, 'r') as file:
-            data = json.load(file)
-            json_file = JSONFile(**data)
+        with open(json_config_file.get("json_dir")+file_name, 'rb') as file:
+            json_file = decode_json_file(get_file_format(file_name), file.read())
 
             return json_file
-    except json.JSONDecodeError as e:
-        logger.error(f"Couldn't read JSON file: {file_name}", error=e)
-        return None
     except ValidationError as e:
         logger.error(f"Error in JSON file's schema, file: {file_name}", error=e)
         return None
@@ -51,61 +151,254 @@ def get_json_file_data(json_config_file: JSONFileConfigType, file_name: str):
         logger.error(f"Unknown error in JSON file, file: {file_name}", error=e)
         return None
 
+async def iter_json_files_data(config: JSONFileConfigType, files: list[str], workers: int | None = JSON_PARSE_WORKERS) -> AsyncGenerator[tuple[str, JSONFile | None]]:
+    """Parse the JSON files in a pool of processes, so they're parsed on all CPU cores,
+    and yield (file_name, file_data) in the same order of the files, file_data is None if the file couldn't be parsed.
+
+    Only a few files are parsed ahead of the one that is yielded, so the parsed files don't pile up in memory if the consumer is slower.
+    Use it like:
+        async for file, file_data in json_utils.iter_json_files_data(config, json_utils.get_json_files(config)):
+            ..."""
+    if len(files) == 0:
+        return
+
+    loop = asyncio.get_running_loop()
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        # forkserver, as forking the app's process - that has running threads - isn't safe.
+        executor: Executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+    else: # a single process costs more than it saves, starting it & sending the parsed files back to us
+        executor = ThreadPoolExecutor(max_workers=1)
+    max_ahead = 2 * workers
+    try:
+        pending: deque[tuple[str, asyncio.Future[JSONFile | None]]] = deque()
+        files_iter = iter(files)
+        for file in files_iter:
+            pending.append((file, loop.run_in_executor(executor, get_json_file_data, config, file)))
+            if len(pending) >= max_ahead:
+                break
+
+        while len(pending) > 0:
+            file, future = pending.popleft()
+            next_file = next(files_iter, None)
+            if next_file is not None:
+                pending.append((next_file, loop.run_in_executor(executor, get_json_file_data, config, next_file)))
+            try:
+                file_data = await future
+            except Exception as e: # like the process that was parsing it was killed
+                logger.error(f"Couldn't parse JSON file in a worker process, file: {file}", error=e)
+                file_data = None
+            yield file, file_data
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def del_files(config: JSONFileConfigType):
     """Delete all JSON files"""
-    files = [file for file in os.listdir(config.get("json_dir")) if file.endswith('.json')]
+    files = get_json_files(config)
     for file in files:   
         os.remove(path=config.get("json_dir")+file)
 
     return None
 
-def write_json_files(config: JSONFileConfigType, items: list[Any]):
-    """Every file will have a max number of items = DEFAULT_MAX_LENGTH, the naming convention will use a standard function: get_block_file_name()"""
-    # Seperate blocks by their priority, using it's priority as a key for the dict.
-    priority_items: dict[int, list[Any]] = {}
-    for item in items: 
-            if priority_items.get(item.priority) is None:
-                priority_items[item.priority] = []
+def get_file_hash(path: str) -> str | None:
+    """Get sha256 hex digest of the file's content, or None if it doesn't exist."""
+    try:
+        with open(path, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
 
-            priority_items[item.priority].append(item)
+def write_file_atomically(path: str, content: bytes):
+    """Write the file's content to a temp file in the same directory then rename it, so the file is never half-written."""
+    directory, file_name = os.path.split(path)
+    temp_fd, temp_path = tempfile.mkstemp(dir=directory or None, prefix=f".{file_name}.", suffix=".tmp")
+    try:
+        os.fchmod(temp_fd, 0o644) # mkstemp creates it readable by its owner only
+        with os.fdopen(temp_fd, "wb") as file:
+            _ = file.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
 
-    for key,value in priority_items.items():
-        __write_files(config, priority=key, items=value)
+def write_json_files(config: JSONFileConfigType, items: list[Any]):
+    """Every file will have a max number of items = config's items_max_length, the naming convention will use a standard function: format_file_name()"""
+    writer = JSONFilesWriter(config)
+    # sorted() is stable, so items keep their order inside every priority.
+    for item in sorted(items, key=lambda item: item.priority):
+        writer.add(item)
+    writer.close()
 
     return
 
-def __write_files(config: JSONFileConfigType, priority: int, items: list[Any]):
-    items_count = len(items)
-    # Here we get the count of files we need, like if len(blocks) = 2500, it'll be:
-    # (2440 + (100-2440%100)) / 100 = 25.0 --> converted to int by int(25.0) = 25
-    files_count = int((items_count + (DEFAULT_MAX_LENGTH - items_count % DEFAULT_MAX_LENGTH)) / DEFAULT_MAX_LENGTH)
 
-    # list's start & end are used to slice the array, like [start:end]...etc
-    list_start = 0
-    list_end = DEFAULT_MAX_LENGTH
-    file_number = 1
+class JSONFilesWriter():
+    """Writes items ordered by their priority to JSON files, a file is written as soon as it's full (has config's items_max_length items),
+    so only a single file's items are kept in memory, however many items are written. Use it like:
+        writer = JSONFilesWriter(config)
+        async for item in items_ordered_by_priority:
+            await writer.async_add(item)
+        await writer.async_close() # writes the last file, and deletes the obsolete ones
+
+    async_add() & async_close() encode, hash & write the files in a thread, so an export doesn't block the event loop,
+    while add() & close() do it in the caller's thread, for sync code.
+
+    Files are synced incrementally: a file is only written if its content's hash changed,
+    and it's written to a temp file then renamed, so a file is never half-written.
+    The obsolete files (that weren't produced by this writer) are deleted only on close(), after all files are written,
+    then the manifest (MANIFEST_FILE_NAME) is written, listing every file with its hash, items count, priority and key range."""
+    def __init__(self, config: JSONFileConfigType):
+        self.config: JSONFileConfigType = config
+        self.items_max_length: int = config.get("items_max_length") if config.get("format") == "ndjson.zst" else min(config.get("items_max_length"), DEFAULT_MAX_LENGTH)
+        self.files_count: int = 0
+        self.files_written: int = 0 # new or changed files
+        self.files_unchanged: int = 0
+        self.files_deleted: int = 0
+        self.__file_names: set[str] = set() # all files produced by this writer
+        self.__manifest_files: list[ManifestFile] = []
+        self.__priority: int | None = None
+        self.__file_number: int = 0
+        self.__items: list[Any] = []
+
+    def add(self, item: Any):
+        for json_file in self.__add(item):
+            _ = self.__write_file(json_file)
 
-    while file_number <= files_count:
+    async def async_add(self, item: Any):
+        for json_file in self.__add(item):
+            _ = await asyncio.to_thread(self.__write_file, json_file)
 
-        json_file = JSONFile(
-            priority=priority,
-            file_number=file_number,
-            items=items[list_start:list_end]
+    def close(self):
+        json_file = self.__take_current_file()
+        if json_file is not None:
+            _ = self.__write_file(json_file)
+        self.__delete_obsolete_files()
+        self.__write_manifest()
+        logger.info(
+            "Synced JSON files",
+            name_prefix=self.config.get("name_prefix"),
+            files_count=self.files_count,
+            files_written=self.files_written,
+            files_unchanged=self.files_unchanged,
+            files_deleted=self.files_deleted
             )
 
-        _ = __write_file(config, json_file, file_number )
-        list_start += DEFAULT_MAX_LENGTH
-        list_end += DEFAULT_MAX_LENGTH
-        file_number += 1
+    async def async_close(self):
+        await asyncio.to_thread(self.close)
 
+    def __add(self, item: Any) -> list[JSONFile]:
+        """Add the item to the current file, and return the files that are done (full, or of the previous priority) to be written."""
+        done_files: list[JSONFile] = []
+        if self.__priority is None or item.priority != self.__priority:
+            if self.__priority is not None and item.priority < self.__priority:
+                raise ValueError(f"Items should be ordered by priority, got priority {item.priority} after {self.__priority}")
+            json_file = self.__take_current_file()
+            if json_file is not None:
+                done_files.append(json_file)
+            self.__priority = item.priority
+            self.__file_number = 0
 
-def __write_file(config: JSONFileConfigType, json_file: JSONFile, file_number: int)->bool:
-    file_name = format_file_name(config.get("name_prefix"), json_file.priority, file_number)
-    try:
-        with open(config.get("json_dir") + f"{file_name}.json", "w") as file:
-            json.dump(json_file.model_dump(mode='json'), file)
+        self.__items.append(item)
+        if len(self.__items) >= self.items_max_length:
+            json_file = self.__take_current_file()
+            if json_file is not None:
+                done_files.append(json_file)
+        return done_files
+
+    def __take_current_file(self) -> JSONFile | None:
+        if self.__priority is None or len(self.__items) == 0:
+            return None
+        self.__file_number += 1
+        json_file = JSONFile.model_construct(priority=self.__priority, file_number=self.__file_number, items=self.__items)
+        self.__items = []
+        self.files_count += 1
+        return json_file
+
+    def __write_file(self, json_file: JSONFile) -> bool:
+        file_name = format_file_name(self.config.get("name_prefix"), json_file.priority, json_file.file_number)
+        extension = get_file_extension(self.config)
+        self.__file_names.add(f"{file_name}{extension}")
+        path = self.config.get("json_dir") + f"{file_name}{extension}"
+        try:
+            content = encode_json_file(self.config, json_file)
+            content_hash = hashlib.sha256(content).hexdigest()
+            keys = [str(getattr(item, self.config.get("key_field"))) for item in json_file.items]
+            self.__manifest_files.append(ManifestFile(
+                file_name=f"{file_name}{extension}",
+                hash=content_hash,
+                items_count=len(json_file.items),
+                priority=json_file.priority,
+                first_key=min(keys) if len(keys) > 0 else None,
+                last_key=max(keys) if len(keys) > 0 else None,
+            ))
+            if get_file_hash(path) == content_hash:
+                self.files_unchanged += 1
+                return True
+
+            write_file_atomically(path, content)
+            self.files_written += 1
             return True
-    except Exception as e:
-        logger.error("Couldn't write JSON file", file_name=file_name, error=e)
-        return False
+        except Exception as e:
+            logger.error("Couldn't write JSON file", file_name=file_name, error=e)
+            return False
+
+    def __delete_obsolete_files(self):
+        # Files of the other format are obsolete too, like after changing the archive's format.
+        for file in os.listdir(self.config.get("json_dir")):
+            if not file.endswith((".json", ".ndjson.zst")) or file in self.__file_names or file == MANIFEST_FILE_NAME:
+                continue
+            try:
+                os.remove(self.config.get("json_dir") + file)
+                self.files_deleted += 1
+            except FileNotFoundError:
+                pass
+
+    def __write_manifest(self):
+        manifest = Manifest(
+            name_prefix=self.config.get("name_prefix"),
+            format=self.config.get("format"),
+            items_count=sum(manifest_file.items_count for manifest_file in self.__manifest_files),
+            files=self.__manifest_files,
+        )
+        path = self.config.get("json_dir") + MANIFEST_FILE_NAME
+        content = manifest.model_dump_json(indent=2).encode()
+        try:
+            if get_file_hash(path) != hashlib.sha256(content).hexdigest():
+                write_file_atomically(path, content)
+        except Exception as e:
+            logger.error("Couldn't write manifest", name_prefix=self.config.get("name_prefix"), error=e)
+
+
+class VerificationResultType(TypedDict):
+    name_prefix: str
+    is_valid: bool
+    checked_count: int
+    missing: list[str] # listed in the manifest, but don't exist
+    mismatched: list[str] # their hash isn't the manifest's one
+    unlisted: list[str] # exist, but aren't listed in the manifest
+
+def verify_json_files(config: JSONFileConfigType, workers: int | None = None) -> VerificationResultType:
+    """Check the json_dir's files against its manifest, hashing the files in a pool of threads,
+    as hashing releases the GIL, so it runs in parallel without parsing any file."""
+    manifest = get_manifest(config)
+    if manifest is None:
+        return VerificationResultType(name_prefix=config.get("name_prefix"), is_valid=False, checked_count=0, missing=[MANIFEST_FILE_NAME], mismatched=[], unlisted=[])
+
+    listed_files = {manifest_file.file_name: manifest_file.hash for manifest_file in manifest.files}
+    existing_files = set(get_json_files(config))
+    missing = sorted(file for file in listed_files if file not in existing_files)
+    unlisted = sorted(file for file in existing_files if file not in listed_files)
+
+    files_to_check = [file for file in listed_files if file in existing_files]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(lambda file: get_file_hash(config.get("json_dir") + file), files_to_check))
+    mismatched = sorted(file for file, file_hash in zip(files_to_check, hashes) if file_hash != listed_files[file])
 
+    return VerificationResultType(
+        name_prefix=config.get("name_prefix"),
+        is_valid=len(missing) == 0 and len(mismatched) == 0 and len(unlisted) == 0,
+        checked_count=len(files_to_check),
+        missing=missing,
+        mismatched=mismatched,
+        unlisted=unlisted,
+    )
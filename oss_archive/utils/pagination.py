@@ -0,0 +1,216 @@
+"""Helpers to get all pages of a paginated listing from sources' APIs,
+the first page tells us how many pages there are, then the rest of them are fetched concurrently."""
+from typing import Any
+from collections.abc import Callable
+import asyncio
+from httpx import URL, Headers, Response
+###
+from oss_archive.utils import httpx
+from oss_archive.utils.logger import logger
+from oss_archive.utils.retry import RetryPolicyType, DEFAULT_RETRY_POLICY
+
+DEFAULT_CONCURRENCY = 4 # max pages fetched at once for a single listing
+
+
+def __add_query(endpoint: str, query: str) -> str:
+    separator = "&" if "?" in endpoint else "?"
+    return f"{endpoint}{separator}{query}"
+
+def __get_page_items(res: Response | None, items_key: str | None = None) -> list[Any] | None:
+    """Get the page's items, from the response's body itself, or from its {items_key} field if it's wrapped (like {"ok": true, "data": [...]})."""
+    if res is None or res.status_code != 200:
+        return None
+    items = res.json()
+    if items_key is not None:
+        items = items.get(items_key) if type(items) is dict else None
+    if type(items) is not list:
+        return None
+    return items
+
+async def __get_rest_pages(
+        base_url: str,
+        endpoints: list[str],
+        concurrency: int,
+        headers: Headers,
+        use_cache: bool,
+        retry_policy: RetryPolicyType
+    ) -> list[list[Any]] | None:
+    """Fetch the endpoints concurrently - at most {concurrency} at once - and return their items in the same order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_page(endpoint: str) -> list[Any] | None:
+        async with semaphore:
+            res = await httpx.async_get(base_url=base_url, endpoint=endpoint, headers=headers, use_cache=use_cache, retry_policy=retry_policy)
+            return __get_page_items(res)
+
+    pages = await asyncio.gather(*[get_page(endpoint) for endpoint in endpoints])
+    for endpoint, page in zip(endpoints, pages):
+        if page is None:
+            logger.error("Couldn't get a page of the listing", base_url=base_url, endpoint=endpoint)
+            return None
+
+    return [page for page in pages if page is not None]
+
+async def async_get_all_pages_by_link(
+        base_url: str,
+        endpoint: str,
+        per_page: int = 100,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        headers: Headers = httpx.DEFAULT_HEADERS,
+        use_cache: bool = False,
+        retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY
+    ) -> list[list[Any]] | None:
+    """Get all pages of a listing that uses per_page/page queries and the Link header, like Github's API.
+    The first page's Link: rel="last" tells us the last page's number, and the rest of the pages are fetched concurrently.
+
+    Returns the items of every page in order, or None if any page couldn't be fetched, so the listing is never silently truncated."""
+    first_res = await httpx.async_get(
+        base_url=base_url,
+        endpoint=__add_query(endpoint, f"per_page={per_page}&page=1"),
+        headers=headers,
+        use_cache=use_cache,
+        retry_policy=retry_policy
+        )
+    first_page = __get_page_items(first_res)
+    if first_res is None or first_page is None:
+        logger.info("Couldn't get the listing's first page", base_url=base_url, endpoint=endpoint, res=first_res)
+        return None
+
+    last_link = first_res.links.get("last")
+    if last_link is None: # it's the only page
+        return [first_page]
+
+    last_page_number = int(URL(last_link["url"]).params.get("page") or 1)
+    rest_pages = await __get_rest_pages(
+        base_url,
+        [__add_query(endpoint, f"per_page={per_page}&page={page}") for page in range(2, last_page_number + 1)],
+        concurrency,
+        headers,
+        use_cache,
+        retry_policy
+        )
+    if rest_pages is None:
+        return None
+
+    return [first_page, *rest_pages]
+
+async def async_get_all_pages_by_total_count(
+        base_url: str,
+        endpoint: str,
+        limit: int = 50,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        headers: Headers = httpx.DEFAULT_HEADERS,
+        use_cache: bool = False,
+        retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY
+    ) -> list[list[Any]] | None:
+    """Get all pages of a listing that uses limit/page queries and the X-Total-Count header,
+    like Gitea/Forgejo's API (Codeberg, our Forgejo instance...etc).
+    The first page's X-Total-Count lets us plan every page up front, then the rest of the pages are fetched concurrently.
+
+    Note: the instance caps the page size by its MAX_RESPONSE_ITEMS setting (50 by default),
+    so if the first page is smaller than the limit while there are more items, its size is used as the limit instead.
+
+    Returns the items of every page in order, or None if any page couldn't be fetched, so the listing is never silently truncated."""
+    first_res = await httpx.async_get(
+        base_url=base_url,
+        endpoint=__add_query(endpoint, f"limit={limit}&page=1"),
+        headers=headers,
+        use_cache=use_cache,
+        retry_policy=retry_policy
+        )
+    first_page = __get_page_items(first_res)
+    if first_res is None or first_page is None:
+        logger.info("Couldn't get the listing's first page", base_url=base_url, endpoint=endpoint, res=first_res)
+        return None
+
+    total_count = first_res.headers.get("X-Total-Count")
+    if total_count is None:
+        return await __get_pages_till_last(base_url, endpoint, limit, first_page, headers, use_cache, retry_policy)
+
+    total = int(total_count)
+    if total <= len(first_page) or len(first_page) == 0:
+        return [first_page]
+
+    page_size = min(limit, len(first_page))
+    pages_count = -(-total // page_size) # ceil division
+    rest_pages = await __get_rest_pages(
+        base_url,
+        [__add_query(endpoint, f"limit={page_size}&page={page}") for page in range(2, pages_count + 1)],
+        concurrency,
+        headers,
+        use_cache,
+        retry_policy
+        )
+    if rest_pages is None:
+        return None
+
+    return [first_page, *rest_pages]
+
+async def __get_pages_till_last(
+        base_url: str,
+        endpoint: str,
+        limit: int,
+        first_page: list[Any],
+        headers: Headers,
+        use_cache: bool,
+        retry_policy: RetryPolicyType
+    ) -> list[list[Any]] | None:
+    """Fallback for instances that don't send X-Total-Count, getting pages one by one till an empty or a partial page."""
+    pages = [first_page]
+    page_size = len(first_page)
+    page_number = 2
+    while len(pages[-1]) > 0 and len(pages[-1]) >= page_size:
+        res = await httpx.async_get(
+            base_url=base_url,
+            endpoint=__add_query(endpoint, f"limit={limit}&page={page_number}"),
+            headers=headers,
+            use_cache=use_cache,
+            retry_policy=retry_policy
+            )
+        page = __get_page_items(res)
+        if page is None:
+            logger.error("Couldn't get a page of the listing", base_url=base_url, endpoint=endpoint, page=page_number)
+            return None
+        if len(page) == 0:
+            break
+        pages.append(page)
+        page_number += 1
+
+    return pages
+
+async def async_get_pages_till(
+        base_url: str,
+        endpoint: str,
+        page_query: Callable[[int], str],
+        is_last_page: Callable[[list[Any]], bool],
+        items_key: str | None = None,
+        max_pages: int = 1000,
+        headers: Headers = httpx.DEFAULT_HEADERS,
+        use_cache: bool = False,
+        retry_policy: RetryPolicyType = DEFAULT_RETRY_POLICY
+    ) -> list[list[Any]] | None:
+    """Get a sorted listing's pages one by one, till an empty page or is_last_page(page) says it's the last one we need,
+    like getting the repos sorted by their last push till the ones that didn't change since the last seeding.
+    page_query(page_number) returns the page's query, like "per_page=100&page=2".
+
+    Returns the items of every page in order, or None if any page couldn't be fetched."""
+    pages: list[list[Any]] = []
+    for page_number in range(1, max_pages + 1):
+        res = await httpx.async_get(
+            base_url=base_url,
+            endpoint=__add_query(endpoint, page_query(page_number)),
+            headers=headers,
+            use_cache=use_cache,
+            retry_policy=retry_policy
+            )
+        page = __get_page_items(res, items_key)
+        if page is None:
+            logger.error("Couldn't get a page of the listing", base_url=base_url, endpoint=endpoint, page=page_number, res=res)
+            return None
+        if len(page) == 0:
+            break
+        pages.append(page)
+        if is_last_page(page):
+            break
+
+    return pages
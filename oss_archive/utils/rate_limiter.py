@@ -0,0 +1,86 @@
+"""A rate-limit aware token bucket, used to pace the requests to an upstream host just under the budget it reports."""
+import asyncio
+import time
+from httpx import Headers
+###
+from oss_archive.utils.logger import logger
+
+
+def parse_rate_limit(headers: Headers) -> tuple[int, float] | None:
+    """Get (remaining requests, seconds left till the reset) from the response's rate-limit headers,
+    or None if it doesn't have them, or they're invalid. It's used for retrying too (see utils/retry)."""
+    remaining = headers.get("X-RateLimit-Remaining") or headers.get("RateLimit-Remaining")
+    reset = headers.get("X-RateLimit-Reset") or headers.get("RateLimit-Reset")
+    if remaining is None or reset is None:
+        return None
+
+    try:
+        remaining_requests = int(remaining)
+        reset_value = float(reset)
+    except ValueError:
+        logger.warning("Invalid rate-limit headers", remaining=remaining, reset=reset)
+        return None
+
+    # Github sends the reset as epoch seconds, while the IETF draft sends the seconds left till the reset.
+    seconds_left = reset_value - time.time() if reset_value > 1_000_000_000 else reset_value
+    return remaining_requests, max(seconds_left, 0.0)
+
+class RateLimiter():
+    """A token bucket for a single host, it doesn't limit anything until the host reports its rate-limit headers:
+    - Github: X-RateLimit-Remaining & X-RateLimit-Reset (epoch seconds)
+    - Forgejo/Codeberg and other IETF draft implementations: RateLimit-Remaining & RateLimit-Reset (seconds till reset)
+
+    Then the remaining budget (multiplied by the safety margin) is spread over the time left till the reset,
+    allowing bursts up to the bucket's capacity, and if the budget is exhausted it waits for the reset.
+    Waiting is done with asyncio.sleep, so it never blocks the event loop."""
+    def __init__(self, host: str, capacity: float, safety_margin: float):
+        self.host: str = host
+        self.capacity: float = capacity
+        self.safety_margin: float = safety_margin
+        self.rate: float | None = None # tokens per second, None means it's unlimited
+        self.__tokens: float = capacity
+        self.__updated_at: float = time.monotonic()
+        self.__blocked_until: float = 0.0
+        self.__lock: asyncio.Lock = asyncio.Lock()
+
+    def __refill(self, now: float):
+        if self.rate is not None:
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+        self.__updated_at = now
+
+    async def acquire(self):
+        """Wait till there's a token to make a request."""
+        async with self.__lock: # waiters take their tokens in order
+            while True:
+                now = time.monotonic()
+                if now < self.__blocked_until:
+                    await asyncio.sleep(self.__blocked_until - now)
+                    continue
+                if self.rate is None:
+                    return
+
+                self.__refill(now)
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.__tokens) / self.rate)
+
+    def update(self, headers: Headers):
+        """Update the bucket's rate from the response's rate-limit headers, if it has them."""
+        rate_limit = parse_rate_limit(headers)
+        if rate_limit is None:
+            return
+        remaining_requests, seconds_left = rate_limit
+        seconds_left = max(seconds_left, 1.0)
+
+        now = time.monotonic()
+        self.__refill(now)
+        budget = remaining_requests * self.safety_margin
+        if budget < 1:
+            self.__blocked_until = now + seconds_left
+            self.__tokens = 0
+            logger.warning("Rate-limit budget is exhausted, waiting till it resets", host=self.host, seconds_left=seconds_left)
+            return
+
+        self.rate = budget / seconds_left
+        self.__tokens = min(self.__tokens, budget)
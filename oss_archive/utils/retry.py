@@ -0,0 +1,136 @@
+"""Retry policies for upstream requests, with exponential backoff, full jitter and Retry-After handling.
+
+A policy is chosen per call site by passing it to the helpers in utils/httpx, like:
+    res = await httpx.async_get(base_url=API_BASE_URL, endpoint="/orgs/forgejo/repos", retry_policy=retry.SEEDING_RETRY_POLICY)
+"""
+from typing import TypedDict
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+import time
+from httpx import Response
+###
+from oss_archive.utils.logger import logger
+from oss_archive.utils.rate_limiter import parse_rate_limit
+
+
+class RetryPolicyType(TypedDict):
+    max_attempts: int # including the first attempt
+    base_delay: float # in seconds, it's doubled on every attempt
+    max_delay: float # max seconds to wait between 2 attempts
+    total_budget: float # max seconds spent on all attempts, it won't wait for a retry that exceeds it
+    retry_on_status: tuple[int, ...]
+    retry_on_errors: bool # retry on network errors/timeouts, not only on connection errors that the transport retries
+
+DEFAULT_RETRY_POLICY = RetryPolicyType(
+    max_attempts=4,
+    base_delay=0.5,
+    max_delay=10.0,
+    total_budget=30.0,
+    retry_on_status=(403, 429, 500, 502, 503, 504),
+    retry_on_errors=True,
+)
+
+# For background work like seeding, where waiting for the source is better than losing an owner's repos.
+SEEDING_RETRY_POLICY = RetryPolicyType(
+    max_attempts=8,
+    base_delay=1.0,
+    max_delay=60.0,
+    total_budget=300.0,
+    retry_on_status=(403, 429, 500, 502, 503, 504),
+    retry_on_errors=True,
+)
+
+# For requests that aren't idempotent (like POST), we only retry when we're sure the upstream didn't process it.
+NON_IDEMPOTENT_RETRY_POLICY = RetryPolicyType(
+    max_attempts=3,
+    base_delay=1.0,
+    max_delay=30.0,
+    total_budget=60.0,
+    retry_on_status=(429,),
+    retry_on_errors=False,
+)
+
+NO_RETRY_POLICY = RetryPolicyType(
+    max_attempts=1,
+    base_delay=0.0,
+    max_delay=0.0,
+    total_budget=0.0,
+    retry_on_status=(),
+    retry_on_errors=False,
+)
+
+# Counters for every host, like: {"https://api.github.com": {"retries": 3, "status_429": 2, "exhausted": 1}}
+retry_counters: dict[str, Counter[str]] = {}
+
+
+def record(host: str, event: str):
+    if retry_counters.get(host) is None:
+        retry_counters[host] = Counter()
+    retry_counters[host][event] += 1
+
+def get_counters() -> dict[str, dict[str, int]]:
+    return {host: dict(counter) for host, counter in retry_counters.items()}
+
+def __is_rate_limited(response: Response) -> bool:
+    """Github answers with 403 for its primary & secondary rate-limits, while a normal 403 shouldn't be retried."""
+    if response.headers.get("Retry-After") is not None:
+        return True
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return True
+    return "rate limit" in response.text.lower()
+
+def __get_retry_after(response: Response) -> float | None:
+    """Seconds to wait, using Retry-After (seconds or HTTP date), or the rate-limit's reset if it's exhausted."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    # Github's X-RateLimit-* or Forgejo/Codeberg's IETF RateLimit-* headers.
+    rate_limit = parse_rate_limit(response.headers)
+    if rate_limit is not None and rate_limit[0] == 0:
+        return rate_limit[1]
+
+    return None
+
+def __get_backoff(policy: RetryPolicyType, attempt: int) -> float:
+    """Exponential backoff with full jitter, so the clients that failed together don't retry together."""
+    return random.uniform(0, min(policy.get("max_delay"), policy.get("base_delay") * 2 ** attempt))
+
+def get_retry_delay(host: str, policy: RetryPolicyType, attempt: int, started_at: float, response: Response | None = None, error: Exception | None = None) -> float | None:
+    """Get the seconds to wait before retrying the failed attempt (counting from 0),
+    or None if it shouldn't be retried, because it succeeded, isn't retryable or the policy's limits are reached."""
+    if response is not None:
+        if response.status_code not in policy.get("retry_on_status"):
+            return None
+        if response.status_code == 403 and not __is_rate_limited(response):
+            return None
+        reason = f"status_{response.status_code}"
+        delay = __get_retry_after(response)
+        if delay is None:
+            delay = __get_backoff(policy, attempt)
+    elif error is not None:
+        if not policy.get("retry_on_errors"):
+            return None
+        reason = type(error).__name__
+        delay = __get_backoff(policy, attempt)
+    else:
+        return None
+
+    record(host, reason)
+    elapsed = time.monotonic() - started_at
+    if attempt + 1 >= policy.get("max_attempts") or elapsed + delay > policy.get("total_budget"):
+        record(host, "exhausted")
+        logger.error("Retries are exhausted", host=host, reason=reason, attempts=attempt + 1, elapsed=elapsed)
+        return None
+
+    record(host, "retries")
+    logger.warning("Retrying request", host=host, reason=reason, attempt=attempt + 1, delay=delay)
+    return delay
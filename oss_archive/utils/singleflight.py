@@ -0,0 +1,70 @@
+"""Coalescing identical in-flight calls, so when multiple callers ask for the same key at once, only one call is made and all of them share its result."""
+from typing import Any, TypeVar
+from collections.abc import Awaitable, Callable
+import asyncio
+import time
+
+ResultType = TypeVar("ResultType")
+
+
+class Singleflight():
+    """The call runs as its own task and callers await it using asyncio.shield,
+    so if a caller is cancelled (like a client disconnecting), it won't cancel the call for the other callers.
+
+    If ttl (in seconds) is more than 0, the result - if it's not None, and keep(result) is True if it's passed - is kept and shared for that duration after the call finishes.
+
+    clear() forgets the in-flight calls too, so the next callers start a fresh call, and every call is tagged by the key's generation
+    when it starts, so a call that started before the last clear() doesn't keep its (stale) result when it finishes."""
+    def __init__(self, ttl: float = 0.0):
+        self.ttl: float = ttl
+        self.__in_flight: dict[str, asyncio.Future[Any]] = {}
+        self.__results: dict[str, tuple[float, Any]] = {} # key: (expires_at, result)
+        self.__generations: dict[str, tuple[int, int]] = {} # key: (how many times it's cleared while calls were running, running calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[ResultType]], keep: Callable[[ResultType], bool] | None = None) -> ResultType:
+        cached = self.__results.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                return result
+            del self.__results[key]
+
+        task = self.__in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.__in_flight[key] = task
+            generation, running = self.__generations.get(key, (0, 0))
+            self.__generations[key] = (generation, running + 1)
+            task.add_done_callback(lambda done_task: self.__done(key, generation, done_task, keep))
+
+        return await asyncio.shield(task)
+
+    def clear(self, key_prefix: str = ""):
+        """Forget the kept results and the in-flight calls, like after a write that changes them, or only the ones that their keys start with key_prefix."""
+        for key in [key for key in self.__results if key.startswith(key_prefix)]:
+            del self.__results[key]
+        for key in [key for key in self.__in_flight if key.startswith(key_prefix)]:
+            del self.__in_flight[key]
+            generation, running = self.__generations[key]
+            self.__generations[key] = (generation + 1, running)
+
+    def __done(self, key: str, generation: int, task: asyncio.Future[Any], keep: Callable[[Any], bool] | None):
+        if self.__in_flight.get(key) is task:
+            del self.__in_flight[key]
+        current_generation, running = self.__generations[key]
+        is_stale = current_generation != generation
+        if running == 1:
+            del self.__generations[key] # no call of an older generation is running anymore
+        else:
+            self.__generations[key] = (current_generation, running - 1)
+        if is_stale or task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+
+        now = time.monotonic()
+        # Drop the expired results, so keys that aren't asked for again don't pile up.
+        for expired_key in [k for k, (expires_at, _) in self.__results.items() if expires_at <= now]:
+            del self.__results[expired_key]
+
+        result = task.result()
+        if result is not None and (keep is None or keep(result)):
+            self.__results[key] = (now + self.ttl, result)